@@ -1,69 +1,220 @@
-from datetime import datetime, date
-from flask import Flask, render_template, request, redirect, url_for, flash, session
-from flask_sqlalchemy import SQLAlchemy
+from flask import Blueprint, Flask, current_app, render_template, request, redirect, url_for, flash, session, jsonify, g, Response
+from metrics import metrics
 import os
+import db
+import passwords
+import schema
 import user
 import budget
-from insta import extract_zip, parse_followers, parse_following
+import forecast
+import rollups
+import importer
+import month_nav
+import assets
+import jobs
+import throttle
+import validation
+import io
+import click
+import csv
+import datetime
+import json
 import logging
+import time
 from logging.handlers import RotatingFileHandler
+from werkzeug.middleware.proxy_fix import ProxyFix
 
-app = Flask(__name__)
-app.secret_key = b'_5#y2L"F4Q8z\n\xec]/'
 admin_users = ['jreid']
-
-# Setup logging
-handler = RotatingFileHandler('app.log', maxBytes=10000, backupCount=1)
-handler.setLevel(logging.INFO)
-app.logger.addHandler(handler)
-
-# Database configuration
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'budget.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-db = SQLAlchemy(app)
-
-# Instagram project configurations
-app.config['UPLOAD_FOLDER'] = 'uploads'
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-
-@app.route('/upload', methods=['GET', 'POST'])
+# Default and longest range offered by the forecast
+FORECAST_MONTHS = 12
+MAX_FORECAST_MONTHS = 600
+
+# Default and longest range offered by the summary
+SUMMARY_MONTHS = 12
+MAX_SUMMARY_MONTHS = 120
+
+# Number of entries shown per page on /edit
+EDIT_PAGE_SIZE = 50
+MAX_EDIT_PAGE_SIZE = 200
+
+# Every page and command lives on this blueprint, create_app registers it on a new app
+bp = Blueprint('main', __name__, cli_group=None)
+
+
+# Function to build and configure the app. Settings can be passed in or set through
+# BUDGET_ prefixed environment variables, e.g. BUDGET_DATABASE=/srv/budget.db
+def create_app(config=None):
+    app = Flask(__name__)
+    app.secret_key = b'_5#y2L"F4Q8z\n\xec]/'
+
+    # Write one structured timing line per request to the log
+    app.config['LOG_REQUESTS'] = True
+    # Log file, or None to log to stderr for a process manager like gunicorn to collect
+    app.config['LOG_FILE'] = os.path.join(basedir, 'app.log')
+
+    # Database configuration
+    app.config['DATABASE'] = os.path.join(basedir, 'budget.db')
+    app.config['DB_POOL_SIZE'] = 5
+
+    # Password hashing configuration, hashes made with a different cost are upgraded on login
+    app.config['BCRYPT_ROUNDS'] = 12
+    app.config['BCRYPT_WORKERS'] = 4
+
+    # Months before and after the current one offered in the /view dropdown
+    app.config['MONTHS_BACK'] = 12
+    app.config['MONTHS_AHEAD'] = 12
+
+    # Instagram exports are analyzed on a background pool, each upload saved to its own temp file
+    app.config['UPLOAD_WORKERS'] = 2
+    app.config['UPLOAD_FOLDER'] = None
+
+    # Login and registration rate limits, 'sqlite' shares the counts between worker processes
+    app.config['THROTTLE_ENABLED'] = True
+    app.config['THROTTLE_STORE'] = 'memory'
+    # Reverse proxies in front of the app whose X-Forwarded-For is trusted for the client address,
+    # 0 when clients connect directly. Without it every client behind a proxy shares one rate limit.
+    app.config['PROXY_HOPS'] = 0
+
+    app.config.from_prefixed_env('BUDGET')
+    if config:
+        app.config.update(config)
+
+    hops = app.config['PROXY_HOPS']
+    if hops:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
+
+    setup_logging(app.config['LOG_FILE'])
+
+    # Each request borrows one pooled connection shared by user.py and budget.py
+    db.init_app(app)
+
+    # Create or upgrade the tables and indexes before serving any requests
+    with app.app_context():
+        schema.migrate()
+
+    passwords.init_app(app)
+    month_nav.init_app(app)
+    jobs.init_app(app)
+    throttle.init_app(app)
+    # Static files get fingerprinted, precompressed copies under /assets
+    assets.init_app(app)
+    app.register_blueprint(bp)
+    return app
+
+
+# Function to attach the log handler to the root logger so user.py and budget.py log to the same place
+def setup_logging(log_file):
+    root = logging.getLogger()
+    if any(getattr(h, 'budget_handler', False) for h in root.handlers):
+        return
+    if log_file:
+        handler = RotatingFileHandler(log_file, maxBytes=1000000, backupCount=3)
+    else:
+        handler = logging.StreamHandler()
+    handler.budget_handler = True
+    handler.setLevel(logging.INFO)
+    handler.setFormatter(logging.Formatter('%(asctime)s %(process)d %(levelname)s %(name)s: %(message)s'))
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+
+# Start the request timer
+@bp.before_app_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+# Record how long the request took and how much of it was spent in the database
+@bp.after_app_request
+def record_timing(response):
+    start = g.pop('request_start', None)
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    metrics.record(f'request.{request.endpoint}', elapsed)
+    if current_app.config['LOG_REQUESTS']:
+        current_app.logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'ms': round(elapsed * 1000, 2),
+            'queries': g.get('query_count', 0),
+            'query_ms': round(g.get('query_ms', 0.0), 2),
+        }))
+    return response
+
+# Route for admins to see timing totals, query stats and cache counters
+@bp.route('/metrics', methods=['GET'])
+def metrics_report():
+    if session.get('username') not in admin_users:
+        return jsonify({'error': 'Unauthorized'}), 403
+    report = metrics.snapshot()
+    report['month_cache'] = budget.month_cache.stats()
+    report['bcrypt'] = passwords.hasher.stats()
+    report['upload_jobs'] = jobs.export_jobs.stats()
+    report['throttle'] = throttle.limiter.stats()
+    # Timings and caches are per worker process, the pid tells them apart
+    report['pid'] = os.getpid()
+    return jsonify(report)
+
+
+@bp.route('/upload', methods=['GET', 'POST'])
 def upload_files():
     if request.method == 'POST':
-        zip_file = request.files['zip_file']
+        zip_file = request.files.get('zip_file')
 
         if not zip_file:
             flash("No file part", 'error')
-            return redirect(url_for('upload_files'))
-
-        zip_path = os.path.join(app.config['UPLOAD_FOLDER'], zip_file.filename)
-        zip_file.save(zip_path)
-
-        extract_to = os.path.join(app.config['UPLOAD_FOLDER'], 'extracted')
-        os.makedirs(extract_to, exist_ok=True)
-        extract_zip(zip_path, extract_to)
+            return redirect(url_for('.upload_files'))
 
-        followers = parse_followers(extract_to)
-        following = parse_following(extract_to)
-        if following is None:
-            flash("following.json not found in the zip file", 'error')
-            return redirect(url_for('upload_files'))
-
-        not_following_back = [user for user in following if user not in followers]
-
-        return render_template('results.html', not_following_back=not_following_back)
+        # Hand the export to the job pool and let the browser poll for the results
+        job = jobs.export_jobs.submit(zip_file.stream)
+        if job['status'] == 'done':
+            return redirect(url_for('.upload_results', job_id=job['id']))
+        return redirect(url_for('.upload_status', job_id=job['id']))
 
     return render_template('insta.html')
 
+# Route to show an upload's progress, refreshing until the analysis is finished
+@bp.route('/upload/<job_id>', methods=['GET'])
+def upload_status(job_id):
+    job = jobs.export_jobs.get(job_id)
+    if job is None:
+        flash("That upload has expired, please upload your file again", 'error')
+        return redirect(url_for('.upload_files'))
+    if job['status'] == 'done':
+        return redirect(url_for('.upload_results', job_id=job_id))
+    return render_template('upload_status.html', job=job)
+
+# Route to show the results of a finished upload
+@bp.route('/upload/<job_id>/results', methods=['GET'])
+def upload_results(job_id):
+    results = jobs.export_jobs.results(job_id)
+    if results is None:
+        return redirect(url_for('.upload_status', job_id=job_id))
+    return render_template('results.html', **results)
+
+# Route for the status of an upload as JSON, with the results once it's done
+@bp.route('/api/upload/<job_id>', methods=['GET'])
+def upload_status_api(job_id):
+    job = jobs.export_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    payload = {'id': job['id'], 'status': job['status'], 'error': job['error']}
+    if job['status'] == 'done':
+        payload['results'] = jobs.export_jobs.results(job_id)
+        payload['results_url'] = url_for('.upload_results', job_id=job_id)
+    return jsonify(payload)
+
 # Main route for the title page
-@app.route('/')
+@bp.route('/')
 def title_page():
-    return render_template('title.html')
+    return assets.pages.respond('title.html')
 
 # Existing routes for the Budget project
-@app.route('/budget-home', methods=['GET', 'POST'])
+@bp.route('/budget-home', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
         if 'reset_username' in request.form:
@@ -78,13 +229,13 @@ def index():
                     flash("Failed to reset password", 'error')
             else:
                 flash("Unauthorized action", 'error')
-            return redirect(url_for('index'))
+            return redirect(url_for('.index'))
 
     is_admin = 'username' in session and session['username'] in admin_users
     return render_template('index.html', is_admin=is_admin)
 
 # Route for admin to reset passwords
-@app.route('/reset-password', methods=['POST'])
+@bp.route('/reset-password', methods=['POST'])
 def reset_password():
     if 'reset_username' in request.form:
         if 'username' in session and session['username'] in admin_users:
@@ -99,31 +250,35 @@ def reset_password():
         else:
             flash("Unauthorized action", 'error')
 
-    return redirect(url_for('index'))
+    return redirect(url_for('.index'))
 
 # Logout route
-@app.route('/logout', methods=['GET'])
+@bp.route('/logout', methods=['GET'])
 def logout():
-    session.pop('username', None)  
-    return redirect(url_for('login'))
+    session.pop('username', None)
+    session.pop('user_id', None)
+    session.pop('name', None)
+    return redirect(url_for('.login'))
 
 # Route to register a new user
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
-        name = request.form['name']
-        username = request.form['username']
-        password = request.form['password']
-        confirm_password = request.form['confirm_password']
-        
-        if password != confirm_password:
-            flash("Passwords do not match", 'error')
+        # Bad input is turned away before it costs a database lookup or a bcrypt hash
+        try:
+            form = validation.registration_form(request.form)
+        except validation.ValidationError as e:
+            flash_errors(e)
             return render_template('register.html')
+        wait = throttle.limiter.retry_after(('register_ip', request.remote_addr))
+        if wait:
+            return too_many_attempts('register.html', wait)
+        throttle.limiter.hit('register_ip', request.remote_addr)
         try:
-            message = user.register_user(name, username, password)
+            message = user.register_user(form['name'], form['username'], form['password'])
             flash(message)
-        except Exception as e:
-            print(f'an error has occurred registering user: {e}')
+        except Exception:
+            current_app.logger.exception('an error has occurred registering user')
             return render_template('error.html', error_message="Failed to register user")
         if message == "Registration successful":
             return redirect('/budget-home') 
@@ -131,34 +286,56 @@ def register():
     return render_template('register.html')
 
 # Route to inject username and name into html
-@app.context_processor
+@bp.app_context_processor
 def inject_logged_in():
     logged_in = 'username' in session
     username = session.get('username', None)
     name = session.get('name', None)
     return {'logged_in': logged_in, 'username': username, 'name': name}
 
+# Helper function to get the logged in user's id from the session
+def current_user_id():
+    # Sessions created before the id was stored look it up once and keep it
+    if 'user_id' not in session and 'username' in session:
+        session['user_id'] = user.get_user_id(session['username'])
+    return session.get('user_id')
+
 # Route to login
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
-        username = request.form['username']
-        password = request.form['password']
+        try:
+            form = validation.login_form(request.form)
+        except validation.ValidationError as e:
+            flash_errors(e)
+            return render_template('login.html')
+        username = form['username']
+        password = form['password']
+        # Bursts from one address, or repeated failures for one username, are refused before bcrypt runs
+        wait = throttle.limiter.retry_after(('login_ip', request.remote_addr), ('login_user', username))
+        if wait:
+            return too_many_attempts('login.html', wait)
+        throttle.limiter.hit('login_ip', request.remote_addr)
         try:
             if user.verify_login(username, password):
-                session['username'] = username  
-                session['name'] = user.get_name(username) 
+                throttle.limiter.reset('login_user', username)
+                # Resolve the profile once so later pages don't look the user up again
+                profile = user.get_profile(username)
+                session['username'] = username
+                session['user_id'] = profile['id']
+                session['name'] = profile['name']
                 flash(f'Welcome {username}', 'success')
-                return redirect(url_for('index'))
+                return redirect(url_for('.index'))
             else:
+                throttle.limiter.hit('login_user', username)
                 flash('Invalid username or password', 'error')
-        except Exception as e:
-            print(f'an error has occurred logging in user: {e}')
+        except Exception:
+            current_app.logger.exception('an error has occurred logging in user')
             return render_template('error.html', error_message="Failed to log in user")        
     return render_template('login.html')
 
 # Route to delete user from the database
-@app.route('/delete', methods=['GET', 'POST'])
+@bp.route('/delete', methods=['GET', 'POST'])
 def delete():
     if request.method == 'POST':
         username = session.get('username')
@@ -166,82 +343,363 @@ def delete():
             user.delete_user(username)
             session.clear()
             flash("Account deleted successfully", 'success')
-            return redirect(url_for('login'))
+            return redirect(url_for('.login'))
         else:
             flash('There has been an error deleting the account.', 'error')
     else:
         return render_template('delete.html')
 
 # Route to change password
-@app.route('/change-password', methods=['GET', 'POST'])
+@bp.route('/change-password', methods=['GET', 'POST'])
 def change_password_route():
     if request.method == 'POST':
-        current_password = request.form.get('current_password')
-        new_password = request.form.get('new_password')
-        confirm_password = request.form.get('confirm_password')
-        username = session['username']
-
-        if new_password != confirm_password:
-            flash('New password and confirm password do not match', 'error')
-            return redirect(url_for('change_password_route'))
         try:
-            user.change_password(username, current_password, new_password)
+            form = validation.password_change_form(request.form)
+        except validation.ValidationError as e:
+            flash_errors(e)
+            return redirect(url_for('.change_password_route'))
+        try:
+            user.change_password(session['username'], form['current_password'], form['new_password'])
             flash('Password changed successfully', 'success')
         except ValueError as e:
             flash(str(e), 'error')
         except Exception as e:
             flash("Failed to update password", 'error')
-        return redirect(url_for('change_password_route'))
+        return redirect(url_for('.change_password_route'))
 
     return render_template('change_password.html')
 
 # Route to build the budget
-@app.route('/budget', methods=['GET', 'POST'])
+@bp.route('/budget', methods=['GET', 'POST'])
 def build_budget():
     if request.method == 'POST':
         try:
-            user_id = user.get_user_id(session.get('username'))
-            description = request.form['description']
-            amount = float(request.form['amount'])
-            type = request.form['type']
-            frequency = request.form['frequency']
-            date = request.form['date']
-            budget.add_budget(user_id, description, amount, type, frequency, date)
+            form = validation.budget_entry_form(request.form)
+        except validation.ValidationError as e:
+            flash_errors(e)
+            return redirect(url_for('.build_budget'))
+        try:
+            budget.add_budget(current_user_id(), form['description'], form['amount'], form['type'],
+                              form['frequency'], form['date'])
             flash('Budget item added successfully!', 'success')
-            return redirect(url_for('build_budget'))
+            return redirect(url_for('.build_budget'))
         except Exception:
+            current_app.logger.exception("An error occurred adding a budget entry")
             return render_template('error.html', error_message="Failed to send to database")
     return render_template('build.html')
 
+# Helper function to show every problem found in a submitted form
+def flash_errors(error):
+    for message in error.errors.values():
+        flash(message, 'error')
+
+# Helper function to send a visitor who isn't logged in to the login page
+def login_redirect():
+    flash("Please log in first", 'error')
+    return redirect(url_for('.login'))
+
+# Helper function to refuse a rate limited form with a 429 saying how long to wait
+def too_many_attempts(template, wait):
+    flash(f"Too many attempts, please try again in {wait} seconds", 'error')
+    return render_template(template), 429, {'Retry-After': str(wait)}
+
+# Helper function to read the forecast range and starting balance from the query string
+def read_forecast_args():
+    args = validation.validate(request.args, {
+        'start': lambda value: validation.parse_month(value or month_nav.navigator.current_month(), 'start'),
+        'months': lambda value: validation.parse_int(value, 'months', FORECAST_MONTHS, 1, MAX_FORECAST_MONTHS),
+        'balance': lambda value: validation.parse_amount(value, 'balance') if value else 0.0,
+    })
+    start_month, months, balance = args['start'], args['months'], args['balance']
+    end_month = forecast.month_key(forecast.month_index(start_month) + months - 1)
+    return start_month, end_month, months, balance
+
+# Route to show month totals and a running balance over a range of months
+@bp.route('/forecast', methods=['GET'])
+def forecast_budget():
+    user_id = current_user_id()
+    if user_id is None:
+        return login_redirect()
+    try:
+        start_month, end_month, months, balance = read_forecast_args()
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('.forecast_budget'))
+    try:
+        rows = forecast.get_user_forecast(user_id, start_month, end_month, balance)
+    except Exception:
+        current_app.logger.exception("An error occurred building the forecast")
+        return render_template('error.html', error_message="Failed to retrieve from database")
+    return render_template('forecast.html', rows=rows, start_month=start_month, months=months, balance=balance)
+
+# Route to return the forecast as JSON for dashboards
+@bp.route('/api/forecast', methods=['GET'])
+def forecast_api():
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({'error': 'Not logged in'}), 401
+    try:
+        start_month, end_month, months, balance = read_forecast_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    rows = forecast.get_user_forecast(user_id, start_month, end_month, balance)
+    return jsonify({
+        'start': start_month,
+        'end': end_month,
+        'starting_balance': balance,
+        'ending_balance': rows[-1]['balance'],
+        'months': rows,
+    })
+
+# Helper function to read the summary range from the query string
+def read_summary_args():
+    args = validation.validate(request.args, {
+        'start': lambda value: validation.parse_month(value or month_nav.navigator.current_month(), 'start'),
+        'months': lambda value: validation.parse_int(value, 'months', SUMMARY_MONTHS, 1, MAX_SUMMARY_MONTHS),
+    })
+    start_month, months = args['start'], args['months']
+    end_month = month_nav.month_key(month_nav.month_index(start_month) + months - 1)
+    return start_month, end_month, months
+
+# Route to show income and expense per month and per description, read from the rollups
+@bp.route('/summary', methods=['GET'])
+def summary():
+    user_id = current_user_id()
+    if user_id is None:
+        return login_redirect()
+    try:
+        start_month, end_month, months = read_summary_args()
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('.summary'))
+    try:
+        monthly = rollups.get_monthly_summary(user_id, start_month, end_month)
+        descriptions = rollups.get_description_summary(user_id, start_month, end_month)
+    except Exception:
+        current_app.logger.exception("An error occurred building the summary")
+        return render_template('error.html', error_message="Failed to retrieve from database")
+    return render_template('summary.html', monthly=monthly, descriptions=descriptions,
+                           start_month=start_month, months=months)
+
+# Route to return the summary as JSON
+@bp.route('/api/summary', methods=['GET'])
+def summary_api():
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({'error': 'Not logged in'}), 401
+    try:
+        start_month, end_month, months = read_summary_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def build_payload():
+        return {
+            'start': start_month,
+            'end': end_month,
+            'months': rollups.get_monthly_summary(user_id, start_month, end_month),
+            'descriptions': rollups.get_description_summary(user_id, start_month, end_month),
+        }
+    return conditional_json(user_id, build_payload)
+
+# Route to download the summary as CSV, one row per month and description
+@bp.route('/summary/export', methods=['GET'])
+def summary_export():
+    user_id = current_user_id()
+    if user_id is None:
+        return login_redirect()
+    try:
+        start_month, end_month, months = read_summary_args()
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('.summary'))
+    rows = rollups.get_rollup_rows(user_id, start_month, end_month)
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['month', 'description', 'income', 'expense', 'net', 'occurrences'])
+    for month, description, income, expense, occurrences in rows:
+        writer.writerow([month, description, f'{income:.2f}', f'{expense:.2f}', f'{income - expense:.2f}', occurrences])
+    return Response(output.getvalue(), mimetype='text/csv', headers={
+        'Content-Disposition': f'attachment; filename=budget-summary-{start_month}-{end_month}.csv',
+    })
+
+# Helper function to answer a JSON API request, or a 304 when the user's data hasn't changed
+def conditional_json(user_id, build_payload):
+    version, updated_at = budget.get_data_version(user_id)
+    today = month_nav.navigator.today()
+    # Month views also change when the day moves the expansion horizon forward
+    start_of_day = datetime.datetime.combine(today, datetime.time.min, tzinfo=datetime.timezone.utc)
+    last_modified = max(updated_at, start_of_day) if updated_at else start_of_day
+    etag = f'{user_id}-{version}-{today.isoformat()}'
+
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    else:
+        not_modified = request.if_modified_since is not None and request.if_modified_since >= last_modified
+    response = Response(status=304) if not_modified else jsonify(build_payload())
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+# Route to return one month of the budget as JSON
+@bp.route('/api/budget', methods=['GET'])
+def budget_api():
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({'error': 'Not logged in'}), 401
+    try:
+        month = validation.parse_month(request.args.get('month') or month_nav.navigator.current_month())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def build_payload():
+        budget_data, total_sum = budget.get_month_budget(user_id, month)
+        entries = [row._asdict() for row in budget_data]
+        return {'month': month, 'entries': entries, 'total': round(total_sum, 2)}
+    return conditional_json(user_id, build_payload)
+
+# Route to return the total for one month as JSON
+@bp.route('/api/totals', methods=['GET'])
+def totals_api():
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({'error': 'Not logged in'}), 401
+    try:
+        month = validation.parse_month(request.args.get('month') or month_nav.navigator.current_month())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def build_payload():
+        budget_data, total_sum = budget.get_month_budget(user_id, month)
+        return {'month': month, 'count': len(budget_data), 'total': round(total_sum, 2)}
+    return conditional_json(user_id, build_payload)
+
+# Route to return one page of the user's budget entries as JSON
+@bp.route('/api/entries', methods=['GET'])
+def entries_api():
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({'error': 'Not logged in'}), 401
+    try:
+        args = validation.entry_page_args(request.args, EDIT_PAGE_SIZE, MAX_EDIT_PAGE_SIZE)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    description, frequency, page_size, after = args['q'], args['frequency'], args['per_page'], args['after']
+
+    def build_payload():
+        budget_entries, next_key = budget.get_budget_entries_page(
+            user_id, after, page_size, description or None, frequency or None)
+        return {
+            'entries': [
+                {'id': entry_id, 'description': desc, 'amount': amount, 'frequency': freq, 'date': entry_date}
+                for desc, amount, freq, entry_date, entry_id in budget_entries
+            ],
+            'next': f'{next_key[0]}:{next_key[1]}' if next_key else None,
+        }
+    return conditional_json(user_id, build_payload)
+
+# Route to import budget entries from a bank CSV or OFX export
+@bp.route('/import', methods=['GET', 'POST'])
+def import_budget():
+    if request.method == 'POST':
+        upload = request.files.get('import_file')
+        if not upload:
+            flash("No file selected", 'error')
+            return redirect(url_for('.import_budget'))
+        file_format = importer.detect_format(upload.filename)
+        text_stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        try:
+            summary = importer.import_file(current_user_id(), text_stream, file_format)
+        except (importer.ImportRowError, UnicodeDecodeError) as e:
+            flash(f"Could not read the file: {e}", 'error')
+            return redirect(url_for('.import_budget'))
+        except Exception:
+            current_app.logger.exception("An error occurred importing budget entries")
+            return render_template('error.html', error_message="Failed to import entries")
+        flash(f"Imported {summary['imported']} entries, skipped {summary['skipped']}", 'success')
+        return render_template('import.html', errors=summary['errors'])
+    return render_template('import.html', errors=[])
+
+# Command to import a bank export from the shell: flask --app app import-budget USERNAME FILE
+@bp.cli.command('import-budget')
+@click.argument('username')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ofx']), default=None)
+@click.option('--chunk-size', default=importer.CHUNK_SIZE, show_default=True)
+def import_budget_command(username, path, file_format, chunk_size):
+    user_id = user.get_user_id(username)
+    if user_id is None:
+        raise click.ClickException(f"User {username} does not exist")
+    file_format = file_format or importer.detect_format(path)
+    progress = lambda count: click.echo(f"  {count} rows imported")
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        try:
+            summary = importer.import_file(user_id, f, file_format, chunk_size, progress)
+        except importer.ImportRowError as e:
+            raise click.ClickException(str(e))
+    click.echo(f"Imported {summary['imported']} entries, skipped {summary['skipped']}")
+    for error in summary['errors']:
+        click.echo(f"  {error}")
+
+# Command to regenerate the month rollups from the budget table: flask --app app rebuild-rollups
+@bp.cli.command('rebuild-rollups')
+@click.option('--username', default=None, help='only rebuild this user')
+def rebuild_rollups_command(username):
+    user_id = None
+    if username:
+        user_id = user.get_user_id(username)
+        if user_id is None:
+            raise click.ClickException(f"User {username} does not exist")
+    rebuilt = rollups.rebuild(user_id)
+    click.echo(f"Rebuilt rollups for {rebuilt} users")
+
+# Command to print every user's month totals as CSV: flask --app app monthly-report --start 2026-01 --months 12
+@bp.cli.command('monthly-report')
+@click.option('--start', default=None, help='first month, YYYY-MM, defaults to the current month')
+@click.option('--months', default=FORECAST_MONTHS, show_default=True, type=click.IntRange(1, MAX_FORECAST_MONTHS))
+def monthly_report_command(start, months):
+    try:
+        start_month = validation.parse_month(start or month_nav.navigator.current_month(), 'start')
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    end_month = forecast.month_key(forecast.month_index(start_month) + months - 1)
+    month_keys = forecast.month_range(start_month, end_month)
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['user_id', 'month', 'total'])
+    click.echo(output.getvalue(), nl=False)
+    # Written out one user at a time as the totals are computed
+    for user_id, totals in forecast.iter_monthly_totals_by_user(start_month, end_month):
+        output.seek(0)
+        output.truncate()
+        writer.writerows((user_id, month, f'{total:.2f}') for month, total in zip(month_keys, totals))
+        click.echo(output.getvalue(), nl=False)
+
 # Route to view the user's budget
-@app.route('/view', methods=['GET'])
+@bp.route('/view', methods=['GET'])
 def view_budget():
-    user_id = user.get_user_id(session.get('username'))
+    user_id = current_user_id()
     selected_month = request.args.get('month', None)
-    
+
+    # If no month is selected, default to the current month
+    if not selected_month:
+        selected_month = month_nav.navigator.current_month()
     try:
-        budget_data = budget.get_user_budget(user_id)
-    except Exception as e:
-        print(f"An error occurred pulling budget data: {e}")
-        return render_template('error.html', error_message="Failed to retrieve from database")
-    
-    # Generate a list of months for the dropdown
-    today = date.today()
-    months = generate_month_list(today)
+        selected_month = validation.parse_month(selected_month)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('.view_budget'))
 
-    # Filter the budget data by selected month if provided
-    if selected_month:
-        budget_data = [entry for entry in budget_data if entry['date'].startswith(selected_month)]
-    else:
-        # If no month is selected, default to the current month
-        selected_month = today.strftime("%Y-%m")
-        budget_data = [entry for entry in budget_data if entry['date'].startswith(selected_month)]
+    # Only the occurrences inside the selected month are expanded, already sorted and totalled
+    try:
+        budget_data, total_sum = budget.get_month_budget(user_id, selected_month)
+    except Exception:
+        current_app.logger.exception("An error occurred pulling budget data")
+        return render_template('error.html', error_message="Failed to retrieve from database")
     
-    # Sort the budget data by date
-    budget_data = sorted(budget_data, key=lambda x: datetime.strptime(x['date'], '%Y-%m-%d'))
-
-    # Calculate the total sum of amounts
-    total_sum = sum(entry['amount'] for entry in budget_data)
+    # The list of months for the dropdown is only rebuilt when the day changes
+    months = month_nav.navigator.months()
     
     return render_template(
         'view.html', 
@@ -251,72 +709,103 @@ def view_budget():
         total_sum=total_sum
     )
 
-# Helper function for viewing the budget
-def generate_month_list(today):
-    # Generate a list of months for the previous year, current year, and next year
-    start_date = today.replace(year=today.year - 1, month=today.month, day=1)
-    end_date = today.replace(year=today.year + 1, month=today.month, day=1)
-    months = []
-    current_date = start_date
-    
-    while current_date <= end_date:
-        months.append(current_date.strftime('%Y-%m'))
-        # Move to the next month
-        if current_date.month == 12:
-            current_date = current_date.replace(year=current_date.year + 1, month=1)
-        else:
-            current_date = current_date.replace(month=current_date.month + 1)
-    
-    return months
-
-# Route to populate the page showing a user's budget entries
-@app.route('/edit', methods=['GET'])
+# Route to populate the page showing a user's budget entries, one page at a time
+@bp.route('/edit', methods=['GET'])
 def edit_budget(): 
     try:
-        # Fetch all budget entries for the logged-in user
-        user_id = user.get_user_id(session.get('username'))
-        budget_entries = budget.get_user_budget_entries(user_id)
-        for i in budget_entries:
-            print(i)
-        return render_template('edit.html', budget_entries=budget_entries)
-    except Exception as e:
-        print(f"An error occurred saving edit: {e}")
+        args = validation.entry_page_args(request.args, EDIT_PAGE_SIZE, MAX_EDIT_PAGE_SIZE)
+    except validation.ValidationError as e:
+        flash_errors(e)
+        return redirect(url_for('.edit_budget'))
+    description, frequency, page_size, after = args['q'], args['frequency'], args['per_page'], args['after']
+    try:
+        # Fetch the next page of budget entries for the logged-in user
+        user_id = current_user_id()
+        budget_entries, next_key = budget.get_budget_entries_page(
+            user_id, after, page_size, description or None, frequency or None)
+    except Exception:
+        current_app.logger.exception("An error occurred loading entries to edit")
         return render_template('error.html', error_message="Failed to retrieve from database")
 
+    filters = {'q': description, 'frequency': frequency, 'per_page': page_size}
+    next_url = None
+    if next_key:
+        next_url = url_for('.edit_budget', after=f'{next_key[0]}:{next_key[1]}', **filters)
+    first_url = url_for('.edit_budget', **filters) if after else None
+    return render_template('edit.html', budget_entries=budget_entries, filters=filters,
+                           next_url=next_url, first_url=first_url)
+
 # Route to edit budget entries
-@app.route('/edit/<int:entry_id>', methods=['POST'])
+@bp.route('/edit/<int:entry_id>', methods=['POST'])
 def edit_budget_entry(entry_id):
     try:
-        updated_description = request.form[f'description_{entry_id}']
-        updated_amount = request.form[f'amount_{entry_id}']
-        updated_frequency = request.form[f'frequency_{entry_id}']
-        updated_date = request.form[f'date_{entry_id}']
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        return render_template('error.html', error_message="Error with form data")
+        update = validation.entry_update_form(request.form, entry_id)
+    except validation.ValidationError as e:
+        flash_errors(e)
+        return redirect(url_for('.edit_budget'))
     try:
-        budget.update_budget_entry(entry_id, updated_description, updated_amount, updated_frequency, updated_date)
-    except Exception as e:
-        print(f"An error occurred saving edit: {e}")
+        # Scoped to the logged in user, so another user's entry id changes nothing
+        updated = budget.update_budget_entries(current_user_id(), [update])
+    except Exception:
+        current_app.logger.exception("An error occurred saving edit")
         return render_template('error.html', error_message="Failed to update entry")
-    flash('Budget entry updated successfully', 'success')
-    return redirect(url_for('edit_budget'))
+    if updated:
+        flash('Budget entry updated successfully', 'success')
+    else:
+        flash('Budget entry not found', 'error')
+    return redirect(url_for('.edit_budget'))
 
 # Route to complete delete entry from user's budget
-@app.route('/delete-entry/<int:entry_id>', methods=['GET'])
+@bp.route('/delete-entry/<int:entry_id>', methods=['GET'])
 def delete_budget_entry(entry_id):
     try:
-        budget.delete_budget_entry(entry_id)
-        flash('Budget entry deleted successfully', 'success')
-    except Exception as e:
-        print(f"An error occurred deleting entry: {e}")
+        deleted = budget.delete_budget_entries(current_user_id(), [entry_id])
+    except Exception:
+        current_app.logger.exception("An error occurred deleting entry")
         return render_template('error.html', error_message="Failed to delete entry")
-    return redirect(url_for('edit_budget'))
+    if deleted:
+        flash('Budget entry deleted successfully', 'success')
+    else:
+        flash('Budget entry not found', 'error')
+    return redirect(url_for('.edit_budget'))
+
+# Route to save every row of the edit page in one transaction
+@bp.route('/edit/batch', methods=['POST'])
+def edit_budget_entries():
+    # Every row is checked before any of them are written
+    try:
+        updates = [validation.entry_update_form(request.form, entry_id)
+                   for entry_id in request.form.getlist('entry_id', type=int)]
+    except validation.ValidationError as e:
+        flash_errors(e)
+        return redirect(url_for('.edit_budget'))
+    try:
+        updated = budget.update_budget_entries(current_user_id(), updates)
+    except Exception:
+        current_app.logger.exception("An error occurred saving edits")
+        return render_template('error.html', error_message="Failed to update entries")
+    flash(f'{updated} budget entries updated successfully', 'success')
+    return redirect(url_for('.edit_budget'))
+
+# Route to delete every selected entry in one transaction
+@bp.route('/delete-entries', methods=['POST'])
+def delete_budget_entries():
+    entry_ids = request.form.getlist('selected', type=int)
+    if not entry_ids:
+        flash('No budget entries selected', 'error')
+        return redirect(url_for('.edit_budget'))
+    try:
+        deleted = budget.delete_budget_entries(current_user_id(), entry_ids)
+    except Exception:
+        current_app.logger.exception("An error occurred deleting entries")
+        return render_template('error.html', error_message="Failed to delete entries")
+    flash(f'{deleted} budget entries deleted successfully', 'success')
+    return redirect(url_for('.edit_budget'))
 
 
-@app.route('/resume')
+@bp.route('/resume')
 def resume():
-    return render_template('resume.html')
+    return assets.pages.respond('resume.html')
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app().run(debug=True)
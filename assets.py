@@ -0,0 +1,151 @@
+from flask import Blueprint, abort, current_app, redirect, render_template, request, session, url_for
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import posixpath
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Files bigger than this are left to the plain /static route
+MAX_ASSET_SIZE = 5 * 1024 * 1024
+# A compressed copy is only kept when it saves at least this share of the bytes
+MIN_SAVING = 0.1
+IMMUTABLE = 'public, max-age=31536000, immutable'
+PAGE_CACHE_CONTROL = 'public, max-age=300'
+
+bp = Blueprint('assets', __name__)
+
+
+# One response body kept with its gzip and brotli copies and an ETag
+class CompressedBody:
+    def __init__(self, data, mimetype):
+        self.mimetype = mimetype
+        self.etag = hashlib.sha256(data).hexdigest()[:16]
+        self.encodings = {'identity': data}
+        for encoding, compress in (('br', brotli and brotli.compress), ('gzip', _gzip)):
+            if compress:
+                packed = compress(data)
+                if len(packed) <= len(data) * (1 - MIN_SAVING):
+                    self.encodings[encoding] = packed
+
+    # Function to pick the smallest encoding the client accepts
+    def choose(self, accept_encodings):
+        for encoding in ('br', 'gzip'):
+            if encoding in self.encodings and accept_encodings[encoding]:
+                return encoding
+        return 'identity'
+
+    # Function to build the response for the current request, or a 304 when the client has it
+    def respond(self, cache_control):
+        encoding = self.choose(request.accept_encodings)
+        response = current_app.response_class(self.encodings[encoding], mimetype=self.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        if len(self.encodings) > 1:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = cache_control
+        response.set_etag(f'{self.etag}-{encoding}')
+        return response.make_conditional(request)
+
+
+# Function to gzip with a fixed timestamp so every worker produces the same bytes
+def _gzip(data):
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+# Fingerprinted, precompressed copies of the files in static/
+class AssetManifest:
+    def __init__(self):
+        self.urls = {}
+        self.assets = {}
+
+    # Function to read and compress every static file once
+    def load(self, folder):
+        self.urls = {}
+        self.assets = {}
+        for root, dirs, files in os.walk(folder):
+            dirs[:] = [name for name in dirs if not name.startswith('.')]
+            for name in files:
+                path = os.path.join(root, name)
+                if name.startswith('.') or os.path.getsize(path) > MAX_ASSET_SIZE:
+                    continue
+                with open(path, 'rb') as f:
+                    data = f.read()
+                filename = os.path.relpath(path, folder).replace(os.sep, '/')
+                mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                body = CompressedBody(data, mimetype)
+                stem, ext = posixpath.splitext(filename)
+                fingerprinted = f'{stem}.{body.etag[:12]}{ext}'
+                self.urls[filename] = fingerprinted
+                self.assets[fingerprinted] = body
+
+    # Function to get the fingerprinted name of a static file, None when it isn't managed
+    def lookup(self, filename):
+        return self.urls.get(filename)
+
+
+manifest = AssetManifest()
+
+
+# Function for templates to link a static file by a URL that changes with its content
+def asset_url(filename):
+    fingerprinted = manifest.lookup(filename)
+    if fingerprinted is None:
+        return url_for('static', filename=filename)
+    return url_for('assets.serve', filename=fingerprinted)
+
+
+# Route to serve a fingerprinted static file, cached by browsers for a year
+@bp.route('/assets/<path:filename>')
+def serve(filename):
+    body = manifest.assets.get(filename)
+    if body is not None:
+        return body.respond(IMMUTABLE)
+    # An old fingerprint is sent on to the current copy of the file
+    stem, ext = posixpath.splitext(filename)
+    original = posixpath.splitext(stem)[0] + ext
+    if manifest.lookup(original):
+        return redirect(asset_url(original))
+    abort(404)
+
+
+# Pages whose HTML is the same for every visitor, rendered once and kept compressed
+class PageCache:
+    def __init__(self):
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    # Function to answer with the cached page, rendering it on first use
+    def respond(self, template_name):
+        # Pending flash messages belong to one visitor, so that page is rendered fresh
+        if current_app.debug or (current_app.config['SESSION_COOKIE_NAME'] in request.cookies
+                                 and session.get('_flashes')):
+            return render_template(template_name)
+        body = self._pages.get(template_name)
+        if body is None:
+            html = render_template(template_name).encode('utf-8')
+            with self._lock:
+                body = self._pages.setdefault(template_name, CompressedBody(html, 'text/html'))
+        return body.respond(PAGE_CACHE_CONTROL)
+
+    # Function to drop the cached pages, e.g. after templates change
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+
+pages = PageCache()
+
+
+# Function to fingerprint the static folder and register the asset route on the app
+def init_app(app):
+    manifest.load(app.static_folder)
+    pages.clear()
+    app.register_blueprint(bp)
+    app.add_template_global(asset_url)
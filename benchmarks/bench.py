@@ -0,0 +1,225 @@
+"""Benchmarks for the budget expansion, /view and Instagram diff hot paths.
+
+Run from the project root:
+
+    python -m benchmarks.bench                     # run and save benchmarks/results/latest.json
+    python -m benchmarks.bench --save-baseline     # also store the run as the baseline
+    python -m benchmarks.bench --compare           # compare against the stored baseline
+"""
+from datetime import date
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks import generators
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+BASELINE = os.path.join(RESULTS_DIR, 'baseline.json')
+LATEST = os.path.join(RESULTS_DIR, 'latest.json')
+
+
+# Function to time a callable and record its latency percentiles and allocations
+def measure(func, repeat, warmup=2):
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    # Allocations are measured on a separate run so tracing doesn't skew the timings
+    tracemalloc.start()
+    func()
+    current, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count for stat in snapshot.statistics('filename'))
+
+    timings.sort()
+    return {
+        'repeat': repeat,
+        'mean_ms': round(statistics.fmean(timings), 4),
+        'p50_ms': round(percentile(timings, 50), 4),
+        'p95_ms': round(percentile(timings, 95), 4),
+        'p99_ms': round(percentile(timings, 99), 4),
+        'peak_kb': round(peak / 1024, 1),
+        'retained_blocks': blocks,
+    }
+
+
+# Function to pick a percentile out of sorted timings
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, round(pct / 100 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+# Function to set up the app against a temporary database with a synthetic user
+def setup_app(entries):
+    import app as app_module
+    import db
+
+    flask_app = app_module.create_app({
+        'DATABASE': os.path.join(tempfile.mkdtemp(), 'bench.db'),
+        'TESTING': True,
+        # Keep the request log out of app.log, the timings are measured here instead
+        'LOG_FILE': None,
+        'LOG_REQUESTS': False,
+    })
+    with flask_app.app_context():
+        user_id = generators.populate(db.get_connection(), 'bench', generators.make_entries(entries))
+    return flask_app, user_id
+
+
+# Function to check the forecast engine against expanding every occurrence with
+# budget.iter_occurrences, raising when any month is off by a cent or more
+def check_forecast_engine(entries=3000, years=10):
+    import budget
+    import forecast
+
+    rows = generators.make_entries(entries, years_back=years, seed=1)
+    current = forecast.month_index(date.today())
+    first_month = forecast.month_key(current - 12 * years)
+    last_month = forecast.month_key(current + 12 * years - 1)
+    months = forecast.month_range(first_month, last_month)
+    window_start = date.fromisoformat(f'{first_month}-01')
+    window_end = budget.month_bounds(last_month)[1]
+
+    expected = dict.fromkeys(months, 0.0)
+    for _, amount, frequency, start_date in rows:
+        for occurrence in budget.iter_occurrences(date.fromisoformat(start_date), frequency, window_start, window_end):
+            expected[occurrence.strftime('%Y-%m')] += amount
+    totals = forecast.monthly_totals([row[1:] for row in rows], first_month, last_month)
+
+    mismatches = [(month, round(expected[month], 2), total) for month, total in zip(months, totals)
+                  if abs(expected[month] - total) >= 0.01]
+    if mismatches:
+        raise AssertionError(f'forecast.monthly_totals differs from iter_occurrences: {mismatches[:5]}')
+    print(f'forecast.monthly_totals matches iter_occurrences on {entries} entries over {len(months)} months')
+
+
+# Function to build every benchmark as (name, callable, repeat)
+def build_benchmarks(entries, accounts, repeat):
+    import budget
+    import insta
+    import month_nav
+
+    flask_app, user_id = setup_app(entries)
+    rows = generators.make_entries(entries)
+    month = date.today().strftime('%Y-%m')
+    window = budget.month_bounds(month)
+    export = generators.make_export(accounts, accounts)
+
+    client = flask_app.test_client()
+    with client.session_transaction() as session:
+        session['username'] = 'bench'
+        session['user_id'] = user_id
+        session['name'] = 'bench'
+
+    def month_budget_cold():
+        with flask_app.app_context():
+            budget.month_cache.clear()
+            budget.get_month_budget(user_id, month)
+
+    def view_request():
+        budget.month_cache.clear()
+        client.get(f'/view?month={month}')
+
+    def view_request_cached():
+        client.get(f'/view?month={month}')
+
+    def parse_export():
+        with insta.open_export(io.BytesIO(export)) as zip_ref:
+            list(insta.iter_followers(zip_ref))
+            list(insta.iter_following(zip_ref))
+
+    def diff_export():
+        with insta.open_export(io.BytesIO(export)) as zip_ref:
+            insta.diff_followers(insta.iter_followers(zip_ref), insta.iter_following(zip_ref))
+
+    followers = [f'account{i}' for i in range(accounts)]
+    following = [f'account{i}' for i in range(accounts // 2, accounts + accounts // 2)]
+
+    return [
+        (f'calculate_budget.full[{entries}]', lambda: budget.calculate_budget(rows), max(3, repeat // 10)),
+        (f'calculate_budget.month[{entries}]', lambda: budget.calculate_budget(rows, *window), repeat),
+        (f'get_month_budget.cold[{entries}]', month_budget_cold, repeat),
+        (f'view.request[{entries}]', view_request, repeat),
+        (f'view.request_cached[{entries}]', view_request_cached, repeat),
+        ('generate_month_list', lambda: month_nav.generate_month_list(date.today()), repeat),
+        ('month_nav.months', month_nav.navigator.months, repeat),
+        (f'insta.parse[{accounts}]', parse_export, max(3, repeat // 10)),
+        (f'insta.diff_export[{accounts}]', diff_export, max(3, repeat // 10)),
+        (f'insta.diff_followers[{accounts}]', lambda: insta.diff_followers(followers, following), repeat),
+    ]
+
+
+# Function to print how each benchmark moved against the baseline
+def compare(results, baseline, threshold):
+    regressions = 0
+    print(f"{'benchmark':40} {'baseline p50':>14} {'p50':>10} {'change':>8}")
+    for name, result in results['benchmarks'].items():
+        base = baseline['benchmarks'].get(name)
+        if not base:
+            print(f'{name:40} {"-":>14} {result["p50_ms"]:>10.3f} {"new":>8}')
+            continue
+        change = (result['p50_ms'] - base['p50_ms']) / base['p50_ms'] if base['p50_ms'] else 0.0
+        flag = ' REGRESSION' if change > threshold else ''
+        regressions += bool(flag)
+        print(f'{name:40} {base["p50_ms"]:>14.3f} {result["p50_ms"]:>10.3f} {change:>+8.1%}{flag}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=500, help='budget entries for the synthetic user')
+    parser.add_argument('--accounts', type=int, default=20000, help='accounts in the synthetic Instagram export')
+    parser.add_argument('--repeat', type=int, default=50, help='timed runs per benchmark')
+    parser.add_argument('--filter', default='', help='only run benchmarks whose name contains this text')
+    parser.add_argument('--output', default=LATEST, help='where to write the JSON results')
+    parser.add_argument('--save-baseline', action='store_true', help='also store this run as the baseline')
+    parser.add_argument('--compare', action='store_true', help='compare against the stored baseline')
+    parser.add_argument('--threshold', type=float, default=0.10, help='p50 slowdown reported as a regression')
+    args = parser.parse_args(argv)
+
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {'entries': args.entries, 'accounts': args.accounts, 'repeat': args.repeat},
+        'benchmarks': {},
+    }
+    check_forecast_engine()
+    for name, func, repeat in build_benchmarks(args.entries, args.accounts, args.repeat):
+        if args.filter not in name:
+            continue
+        results['benchmarks'][name] = measure(func, repeat)
+        result = results['benchmarks'][name]
+        print(f"{name:40} p50 {result['p50_ms']:>9.3f} ms  p95 {result['p95_ms']:>9.3f} ms  peak {result['peak_kb']:>9.1f} KB")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    outputs = [args.output] + ([BASELINE] if args.save_baseline else [])
+    for path in outputs:
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        if not os.path.exists(BASELINE):
+            print(f'No baseline at {BASELINE}, run with --save-baseline first')
+            return 1
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+        return 1 if compare(results, baseline, args.threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
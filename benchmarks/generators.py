@@ -0,0 +1,64 @@
+import datetime
+import io
+import json
+import random
+import zipfile
+
+FREQUENCIES = ('one_time', 'weekly', 'monthly', 'quarterly', 'yearly')
+
+
+# Function to make synthetic budget rows (description, amount, frequency, date)
+def make_entries(count, frequencies=FREQUENCIES, years_back=5, seed=0):
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    rows = []
+    for i in range(count):
+        start = today - datetime.timedelta(days=rng.randint(0, 365 * years_back))
+        amount = round(rng.uniform(-2000, 2000), 2)
+        rows.append((f'entry {i}', amount, frequencies[i % len(frequencies)], start.isoformat()))
+    return rows
+
+
+# Function to insert synthetic rows for one user and return the user's id
+def populate(conn, username, rows):
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO users (name, username, password_hash) VALUES (?, ?, ?)",
+                   (username, username, 'not-a-real-hash'))
+    user_id = cursor.lastrowid
+    cursor.executemany('''
+        INSERT INTO budget (user_id, description, amount, frequency, date)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(user_id,) + row for row in rows])
+    conn.commit()
+    return user_id
+
+
+# Function to build a follower item in Instagram's export format
+def _relationship(username):
+    return {
+        'title': '',
+        'media_list_data': [],
+        'string_list_data': [{
+            'href': f'https://www.instagram.com/{username}',
+            'value': username,
+            'timestamp': 1700000000,
+        }],
+    }
+
+
+# Function to make an in-memory Instagram export zip with the given account counts
+def make_export(followers, following, overlap=0.5, seed=0):
+    rng = random.Random(seed)
+    shared = int(min(followers, following) * overlap)
+    follower_names = [f'account{i}' for i in range(followers)]
+    following_names = follower_names[:shared] + [f'other{i}' for i in range(following - shared)]
+    rng.shuffle(following_names)
+
+    buffer = io.BytesIO()
+    folder = 'connections/followers_and_following/'
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.writestr(folder + 'followers_1.json',
+                         json.dumps([_relationship(name) for name in follower_names], indent=2))
+        zip_ref.writestr(folder + 'following.json',
+                         json.dumps({'relationships_following': [_relationship(name) for name in following_names]}, indent=2))
+    return buffer.getvalue()
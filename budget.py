@@ -1,33 +1,104 @@
+from cache import LRUCache
 from dateutil.relativedelta import relativedelta
+from db import get_connection
+from metrics import metrics
+from month_nav import navigator
+
+from collections import namedtuple
 
 import datetime
-import sqlite3
-import threading
+import logging
+import rollups
+
+logger = logging.getLogger(__name__)
+
+# One occurrence of an entry: day ordinal, index into the shared descriptions and amount.
+# Plain tuples sort natively by date, then by the order the entries were read in.
+Occurrence = namedtuple('Occurrence', 'ordinal entry amount')
+
+# A row as shown on the page, only built while it is being rendered
+BudgetRow = namedtuple('BudgetRow', 'description amount date')
+
+
+# Compact, date ordered occurrences for a window with their total
+class BudgetOccurrences:
+    __slots__ = ('occurrences', 'descriptions', 'total')
+
+    def __init__(self, occurrences, descriptions, total):
+        self.occurrences = occurrences
+        self.descriptions = descriptions
+        self.total = total
+
+    def __len__(self):
+        return len(self.occurrences)
+
+    def __iter__(self):
+        return self.rows()
 
+    # Function to yield displayable rows, formatting each date as it is reached
+    def rows(self):
+        descriptions = self.descriptions
+        fromordinal = datetime.date.fromordinal
+        for ordinal, entry, amount in self.occurrences:
+            yield BudgetRow(descriptions[entry], amount, fromordinal(ordinal).isoformat())
 
 
-# Create a thread-local storage for the SQLite connection
-local = threading.local()
+# Expanded months keyed by (user_id, month, horizon), cleared when the user's entries change
+month_cache = LRUCache(maxsize=512)
 
 
-# Functions to connect to the SQLite database
-def get_connection():
-    if not hasattr(local, 'conn'):
-        local.conn = sqlite3.connect('budget.db')
-    return local.conn
+# Function to drop every cached month for a user after their entries change
+def invalidate_user_cache(user_id):
+    month_cache.invalidate(lambda key: key[0] == user_id)
 
 
-def close_connection():
-    if hasattr(local, 'conn'):
-        local.conn.close()
-        del local.conn
+# Function to bump a user's data version, called inside the same transaction as the write
+def bump_data_version(cursor, user_id):
+    cursor.execute('''
+        INSERT INTO budget_versions (user_id, version, updated_at)
+        VALUES (?, 1, ?)
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at
+    ''', (user_id, datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')))
+
+
+# Function to get a user's data version and when it last changed
+def get_data_version(user_id):
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT version, updated_at FROM budget_versions WHERE user_id = ?", (user_id,))
+    result = cursor.fetchone()
+    if result:
+        updated_at = datetime.datetime.strptime(result[1], '%Y-%m-%d %H:%M:%S').replace(tzinfo=datetime.timezone.utc)
+        return result[0], updated_at
+    return 0, None
+
+
+# Function to read (description, amount, frequency, date) for a user's entries, keyed by id
+def get_entries(cursor, user_id, entry_ids):
+    entries = {}
+    entry_ids = list(entry_ids)
+    # Looked up in slices to stay under SQLite's bound parameter limit
+    for start in range(0, len(entry_ids), 500):
+        batch = entry_ids[start:start + 500]
+        cursor.execute(f'''
+            SELECT id, description, amount, frequency, date FROM budget
+            WHERE user_id = ? AND id IN ({', '.join('?' for _ in batch)})
+        ''', (user_id, *batch))
+        for entry_id, *entry in cursor.fetchall():
+            entries[entry_id] = tuple(entry)
+    return entries
+
+
+# Function to give payments a negative amount, deposits keep the sign they were entered with
+def normalize_amount(amount, type):
+    if (type == 'debit'):
+        return -abs(amount)
+    return amount
 
 
 # Function to add entry into budget
 def add_budget(user_id, description, amount, type, frequency, date):
-    if (type == 'debit'):
-        amount = -abs(amount)
-    print(f"user id = {user_id} \ndescription = {description} \namount = {amount} \ntype = {type} \nfrequency = {frequency} \ndate = {date}")
+    amount = normalize_amount(amount, type)
     conn = get_connection()
     cursor = conn.cursor()
     try:
@@ -35,120 +106,249 @@ def add_budget(user_id, description, amount, type, frequency, date):
             INSERT INTO budget (user_id, description, amount, frequency, date)
             VALUES (?, ?, ?, ?, ?)
         ''', (user_id, description, amount, frequency, date))
+        rollups.apply(cursor, user_id, added=[(description, amount, frequency, date)])
+        bump_data_version(cursor, user_id)
         conn.commit()
     except Exception:
-        print("An error has occured inserting database")
-        raise 500
+        logger.exception("An error has occured inserting into the database")
+        raise
+    invalidate_user_cache(user_id)
+
+
+# Function to insert many (description, amount, frequency, date) rows, committing one chunk at a time
+def add_budget_entries(user_id, rows, chunk_size=1000, progress=None):
+    conn = get_connection()
+    cursor = conn.cursor()
+    inserted = 0
+    chunk = []
+    try:
+        for row in rows:
+            chunk.append((user_id,) + tuple(row))
+            if len(chunk) >= chunk_size:
+                inserted += _insert_chunk(conn, cursor, chunk)
+                chunk = []
+                if progress:
+                    progress(inserted)
+        if chunk:
+            inserted += _insert_chunk(conn, cursor, chunk)
+            if progress:
+                progress(inserted)
+    except Exception:
+        logger.exception("An error has occured bulk inserting into the database")
+        raise
     finally:
-        close_connection()
+        if inserted:
+            invalidate_user_cache(user_id)
+    return inserted
+
+
+# Function to write one chunk of rows in a single transaction
+def _insert_chunk(conn, cursor, chunk):
+    cursor.executemany('''
+        INSERT INTO budget (user_id, description, amount, frequency, date)
+        VALUES (?, ?, ?, ?, ?)
+    ''', chunk)
+    rollups.apply(cursor, chunk[0][0], added=[row[1:] for row in chunk])
+    bump_data_version(cursor, chunk[0][0])
+    conn.commit()
+    return len(chunk)
+
+
+# Number of months between occurrences for each monthly based frequency
+MONTH_STEPS = {'monthly': 1, 'quarterly': 3, 'yearly': 12}
+RECURRING_FREQUENCIES = ('weekly',) + tuple(MONTH_STEPS)
+
+
+# Function to pull one month of the user's budget, sorted by date, with its total
+def get_month_budget(user_id, month):
+    # The horizon is part of the key so cached months roll over with the date, and the
+    # data version so a write made by another worker process is never served stale
+    horizon = expansion_horizon()
+    version, _ = get_data_version(user_id)
+    key = (user_id, month, horizon, version)
+    cached = month_cache.get(key)
+    if cached is None:
+        cached = _load_month_budget(user_id, month, horizon)
+        month_cache.set(key, cached)
+    return cached
 
 
-# Function to pull user's budget for the view page
-def get_user_budget(user_id):
-    print(f"Pulling budget for {user_id}")
+# Function to expand one month of the user's budget from the database
+def _load_month_budget(user_id, month, horizon):
+    window_start, window_end = month_bounds(month)
+    window_end = min(window_end, horizon)
+    placeholders = ', '.join('?' for _ in RECURRING_FREQUENCIES)
     conn = get_connection()
     cursor = conn.cursor()
     try:
-        print(f'SELECT description, amount, frequency, date FROM budget WHERE user_id = {user_id};')
-        cursor.execute('''
+        # Only entries that can land in the month: one-time entries dated inside it
+        # and recurring entries that started on or before its last day
+        cursor.execute(f'''
             SELECT description, amount, frequency, date
             FROM budget
-            WHERE user_id = ?
-        ''', (user_id,))
-        data_transaction = cursor.fetchall()
-        budget_data = calculate_budget(data_transaction)
-        return budget_data
-
-    except Exception as e:
-        print(f"An error has occured pulling from database\n {e}")
-        raise 404
-    finally:
-        close_connection()
-
-
-# Function to help organize budget data for viewing
-def calculate_budget(data_transactions):
-    budget_data = []
-
-    def add_transactions(description, amount, start_date, frequency):
-        date = datetime.datetime.strptime(start_date, '%Y-%m-%d')
-        end_date = datetime.datetime.now() + relativedelta(years=1)
-
-        while date <= end_date:
-            budget_data.append({
-                'description': description,
-                'amount': amount,
-                'date': date.strftime('%Y-%m-%d')
-            })
-            # Setting math values for frequency entries
-            if frequency == 'weekly':
-                date += datetime.timedelta(weeks=1)
-            elif frequency == 'monthly':
-                date += relativedelta(months=1)
-            elif frequency == 'quarterly':
-                date += relativedelta(months=3)
-            elif frequency == 'yearly':
-                date += relativedelta(years=1)
-            else:
-                break  # For one-time transactions
-
-    for transaction in data_transactions:
-        description, amount, frequency, start_date = transaction
-        add_transactions(description, amount, start_date, frequency)
-
-    return budget_data
-
-
-# Function to pull SQL entries from the budget table
-def get_user_budget_entries(user_id):
-    print(f"Pulling budget for {user_id}")
+            WHERE user_id = ? AND date <= ?
+              AND (frequency IN ({placeholders}) OR date >= ?)
+            ORDER BY date
+        ''', (user_id, window_end.isoformat(), *RECURRING_FREQUENCIES, window_start.isoformat()))
+        data_transactions = cursor.fetchall()
+    except Exception:
+        logger.exception("An error has occured pulling from database")
+        raise
+
+    with metrics.timed('budget.expand_month'):
+        month_budget = calculate_budget(data_transactions, window_start, window_end)
+    return month_budget, month_budget.total
+
+
+# Function to get the last date recurring entries are expanded to
+def expansion_horizon():
+    return navigator.horizon()
+
+
+# Function to turn a 'YYYY-MM' month into its first and last day
+def month_bounds(month):
+    first_day = datetime.datetime.strptime(month, '%Y-%m').date()
+    last_day = first_day + relativedelta(months=1) - datetime.timedelta(days=1)
+    return first_day, last_day
+
+
+# Function to yield the dates of one transaction that fall inside a window
+def iter_occurrences(start_date, frequency, window_start, window_end):
+    if window_start < start_date:
+        window_start = start_date
+
+    if frequency == 'weekly':
+        # Jump straight to the first week on or after the window start
+        weeks = -(-(window_start - start_date).days // 7)
+        date = start_date + datetime.timedelta(weeks=weeks)
+        while date <= window_end:
+            yield date
+            date += datetime.timedelta(weeks=1)
+    elif frequency in MONTH_STEPS:
+        # Occurrences are always counted from the start date so month end days don't drift
+        step = MONTH_STEPS[frequency]
+        months = (window_start.year - start_date.year) * 12 + window_start.month - start_date.month
+        count = max(0, months // step)
+        date = start_date + relativedelta(months=count * step)
+        while date <= window_end:
+            if date >= window_start:
+                yield date
+            count += 1
+            date = start_date + relativedelta(months=count * step)
+    elif window_start <= start_date <= window_end:
+        yield start_date  # For one-time transactions
+
+
+# Function to help organize budget data for viewing, returns the occurrences sorted by date
+def calculate_budget(data_transactions, window_start=None, window_end=None):
+    occurrences = []
+    descriptions = []
+    total = 0
+    horizon = expansion_horizon()
+    if window_end is None or window_end > horizon:
+        window_end = horizon
+
+    with metrics.timed('budget.calculate_budget'):
+        for transaction in data_transactions:
+            description, amount, frequency, start_date = transaction
+            start_date = datetime.date.fromisoformat(start_date)
+            entry = len(descriptions)
+            descriptions.append(description)
+            for date in iter_occurrences(start_date, frequency, window_start or start_date, window_end):
+                occurrences.append(Occurrence(date.toordinal(), entry, amount))
+                total += amount
+        occurrences.sort()
+
+    return BudgetOccurrences(occurrences, descriptions, total)
+
+
+# Function to pull one page of a user's entries ordered by (date, id), starting after
+# the (date, id) key of the previous page, with optional description/frequency filters
+def get_budget_entries_page(user_id, after=None, page_size=50, description=None, frequency=None):
+    conditions = ['user_id = ?']
+    params = [user_id]
+    if description:
+        escaped = description.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        conditions.append("description LIKE ? ESCAPE '\\'")
+        params.append(f'%{escaped}%')
+    if frequency:
+        conditions.append('frequency = ?')
+        params.append(frequency)
+    if after:
+        after_date, after_id = after
+        conditions.append('(date > ? OR (date = ? AND id > ?))')
+        params.extend([after_date, after_date, after_id])
+
     conn = get_connection()
     cursor = conn.cursor()
     try:
-        print(f'SELECT description, amount, frequency, date FROM budget WHERE user_id = {user_id};')
-        cursor.execute('''
+        # One extra row tells us whether there is another page
+        cursor.execute(f'''
             SELECT description, amount, frequency, date, id
             FROM budget
-            WHERE user_id = ?
-        ''', (user_id,))
+            WHERE {' AND '.join(conditions)}
+            ORDER BY date, id
+            LIMIT ?
+        ''', params + [page_size + 1])
         budget_entries = cursor.fetchall()
-        return budget_entries
+    except Exception:
+        logger.exception("An error has occured pulling from database")
+        raise
 
-    except Exception as e:
-        print(f"An error has occured pulling from database\n {e}")
-        raise 404
-    finally:
-        close_connection()
+    next_key = None
+    if len(budget_entries) > page_size:
+        budget_entries = budget_entries[:page_size]
+        next_key = (budget_entries[-1][3], budget_entries[-1][4])
+    return budget_entries, next_key
 
 
-# Function to delete budget entry from database
-def delete_budget_entry(entry_id):
+# Function to update many of a user's entries in one transaction, rows are
+# (entry_id, description, amount, frequency, date)
+def update_budget_entries(user_id, updates):
     conn = get_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("DELETE FROM budget WHERE id = ?", (entry_id,))
+        # Only the user's own entries are changed, and only those reach the rollups. An id
+        # sent twice is applied once, with the last values given for it.
+        removed = get_entries(cursor, user_id, [update[0] for update in updates])
+        if not removed:
+            return 0
+        updates = list({update[0]: update for update in updates if update[0] in removed}.values())
+        cursor.executemany('''
+            UPDATE budget
+            SET description = ?, amount = ?, frequency = ?, date = ?
+            WHERE id = ? AND user_id = ?
+        ''', [(description, amount, frequency, date, entry_id, user_id)
+              for entry_id, description, amount, frequency, date in updates])
+        updated = cursor.rowcount
+        rollups.apply(cursor, user_id, added=[update[1:] for update in updates], removed=removed.values())
+        bump_data_version(cursor, user_id)
         conn.commit()
-        return True
-    except Exception as e:
-        print(f"An error occurred while deleting budget entry: {e}")
-        return False
-    finally:
-        close_connection()
+    except Exception:
+        conn.rollback()
+        logger.exception("An error occurred while updating entries for user %s", user_id)
+        raise
+    invalidate_user_cache(user_id)
+    return updated
 
 
-# Function to update an edited budget entry
-def update_budget_entry(entry_id, updated_description, updated_amount, updated_frequency, updated_date):
+# Function to delete many of a user's entries in one transaction
+def delete_budget_entries(user_id, entry_ids):
     conn = get_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute('''
-            UPDATE budget
-            SET description = ?, amount = ?, frequency = ?, date = ?
-            WHERE id = ?
-        ''', (updated_description, updated_amount, updated_frequency, updated_date, entry_id))
+        removed = get_entries(cursor, user_id, entry_ids)
+        if not removed:
+            return 0
+        cursor.executemany("DELETE FROM budget WHERE id = ? AND user_id = ?",
+                           [(entry_id, user_id) for entry_id in entry_ids])
+        deleted = cursor.rowcount
+        rollups.apply(cursor, user_id, removed=removed.values())
+        bump_data_version(cursor, user_id)
         conn.commit()
-    except Exception as e:
-        print(f"An error occurred while updating entry {entry_id}: {e}")
+    except Exception:
+        conn.rollback()
+        logger.exception("An error occurred while deleting entries for user %s", user_id)
         raise
-    finally:
-        close_connection()
+    invalidate_user_cache(user_id)
+    return deleted
@@ -0,0 +1,47 @@
+from collections import OrderedDict
+
+import threading
+
+
+# Small thread-safe LRU cache that counts its hits and misses
+class LRUCache:
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Function to look up a key, returning default on a miss
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    # Function to store a value, evicting the least recently used key when full
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    # Function to drop every key the predicate matches
+    def invalidate(self, predicate):
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    # Function to empty the cache
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    # Function to report the cache size and hit/miss counters
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
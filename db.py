@@ -0,0 +1,189 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g, has_app_context
+from metrics import metrics
+
+# Absolute path so every module opens the same file no matter the working directory
+DATABASE = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'budget.db')
+POOL_SIZE = 5
+POOL_TIMEOUT = 10
+
+# Pragmas applied once to every new connection
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA foreign_keys = ON',
+    'PRAGMA busy_timeout = 5000',
+    'PRAGMA cache_size = -8000',
+    'PRAGMA temp_store = MEMORY',
+)
+
+# Create a thread-local storage for connections used outside of a request
+local = threading.local()
+
+
+# Cursor that times every statement and counts the rows it returns
+class InstrumentedCursor(sqlite3.Cursor):
+    _sql = ''
+
+    def execute(self, sql, parameters=()):
+        self._sql = sql
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.record_query(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._sql = sql
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.record_query(sql, time.perf_counter() - start, self.rowcount)
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            metrics.record_rows(self._sql, 1)
+        return row
+
+    def fetchall(self):
+        rows = super().fetchall()
+        metrics.record_rows(self._sql, len(rows))
+        return rows
+
+
+# Connection whose cursors are all instrumented
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+
+# Bounded pool of SQLite connections shared by budget.py and user.py
+class ConnectionPool:
+    def __init__(self, path, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+
+    # Function to open a new connection with the tuned pragmas
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False,
+                               factory=InstrumentedConnection)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    # Function to borrow a connection, opening one if the pool isn't full yet
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RuntimeError("Timed out waiting for a database connection")
+
+    # Function to hand a connection back, dropping any unfinished transaction
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put_nowait(conn)
+
+    # Function to close every idle connection
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+# Function to get the pool for a database file
+def get_pool(path=None):
+    path = path or database_path()
+    with _pools_lock:
+        if path not in _pools:
+            size = current_app.config.get('DB_POOL_SIZE', POOL_SIZE) if has_app_context() else POOL_SIZE
+            _pools[path] = ConnectionPool(path, size)
+        return _pools[path]
+
+
+# Function to close and forget every pool, a forked worker process calls this so it
+# opens its own connections instead of sharing the parent's
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close_all()
+        _pools.clear()
+    if hasattr(local, 'conn'):
+        del local.conn
+
+
+# Function to get the configured database path
+def database_path():
+    if has_app_context():
+        return current_app.config.get('DATABASE', DATABASE)
+    return DATABASE
+
+
+# Function to get the connection for the current request, or thread when outside one
+def get_connection():
+    if has_app_context():
+        if 'db_conn' not in g:
+            g.db_conn = get_pool().acquire()
+        return g.db_conn
+    if not hasattr(local, 'conn'):
+        local.conn = get_pool().acquire()
+    return local.conn
+
+
+# Function to return the connection to the pool at the end of a request
+def close_connection(exception=None):
+    if has_app_context():
+        conn = g.pop('db_conn', None)
+        if conn is not None:
+            get_pool().release(conn)
+    elif hasattr(local, 'conn'):
+        get_pool().release(local.conn)
+        del local.conn
+
+
+# Function to hook the connection lifecycle into the Flask app
+def init_app(app):
+    app.config.setdefault('DATABASE', DATABASE)
+    app.config.setdefault('DB_POOL_SIZE', POOL_SIZE)
+    app.teardown_appcontext(close_connection)
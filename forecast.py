@@ -0,0 +1,125 @@
+from budget import MONTH_STEPS, RECURRING_FREQUENCIES
+from db import get_connection
+from metrics import metrics
+from month_nav import month_index, month_key
+
+import datetime
+
+
+# Function to list the 'YYYY-MM' keys from first_month to last_month inclusive
+def month_range(first_month, last_month):
+    return [month_key(index) for index in range(month_index(first_month), month_index(last_month) + 1)]
+
+
+# Function to sum every entry's occurrences per month without expanding them one by one.
+# entries are (amount, frequency, start_date) with the date as 'YYYY-MM-DD'; the result
+# holds one total per month from first_month to last_month.
+def monthly_totals(entries, first_month, last_month):
+    first = month_index(first_month)
+    last = month_index(last_month)
+    length = last - first + 1
+    if length <= 0:
+        return []
+    totals = [0.0] * length
+
+    # Amount that starts repeating at each month offset, one array per step size
+    starts = {step: [0.0] * length for step in set(MONTH_STEPS.values())}
+    weekly = []
+
+    with metrics.timed('forecast.monthly_totals'):
+        for amount, frequency, start_date in entries:
+            start = month_index(start_date)
+            if start > last:
+                continue
+            if frequency == 'weekly':
+                weekly.append((datetime.date.fromisoformat(start_date).toordinal(), amount))
+            elif frequency in MONTH_STEPS:
+                step = MONTH_STEPS[frequency]
+                if start < first:
+                    # First month in range that lines up with the entry's cycle
+                    start = first + (start - first) % step
+                    if start > last:
+                        continue
+                starts[step][start - first] += amount
+            elif start >= first:
+                totals[start - first] += amount  # For one-time transactions
+
+        # A running sum along each stride gives every month the amounts repeating into it
+        for step, added in starts.items():
+            running = [0.0] * length
+            for offset in range(length):
+                running[offset] = added[offset] + (running[offset - step] if offset >= step else 0.0)
+                totals[offset] += running[offset]
+
+        if weekly:
+            _add_weekly(totals, weekly, first)
+
+    return [round(total, 2) for total in totals]
+
+
+# Function to add weekly entries to the month totals, grouped by weekday
+def _add_weekly(totals, weekly, first):
+    weekly.sort()
+    phase_sums = [0.0] * 7
+    pointer = 0
+    for offset in range(len(totals)):
+        index = first + offset
+        month_start = datetime.date(index // 12, index % 12 + 1, 1).toordinal()
+        next_index = index + 1
+        month_end = datetime.date(next_index // 12, next_index % 12 + 1, 1).toordinal() - 1
+
+        # Entries that started before this month are folded into their weekday's sum
+        while pointer < len(weekly) and weekly[pointer][0] < month_start:
+            start, amount = weekly[pointer]
+            phase_sums[start % 7] += amount
+            pointer += 1
+
+        # Entries that start inside this month count from their own start day
+        scan = pointer
+        while scan < len(weekly) and weekly[scan][0] <= month_end:
+            start, amount = weekly[scan]
+            totals[offset] += amount * ((month_end - start) // 7 + 1)
+            scan += 1
+
+        # Entries that started earlier only depend on their weekday
+        for phase, amount in enumerate(phase_sums):
+            if amount:
+                count = (month_end - phase) // 7 - (month_start - 1 - phase) // 7
+                totals[offset] += amount * count
+
+
+# Function to read the (amount, frequency, date) rows of a user's entries that can land in a range
+def get_range_entries(user_id, first_month, last_month):
+    placeholders = ', '.join('?' for _ in RECURRING_FREQUENCIES)
+    conn = get_connection()
+    cursor = conn.cursor()
+    # Same filter as the month view: only entries that can land in the range
+    cursor.execute(f'''
+        SELECT amount, frequency, date
+        FROM budget
+        WHERE user_id = ? AND date <= ?
+          AND (frequency IN ({placeholders}) OR date >= ?)
+    ''', (user_id, month_key(month_index(last_month)) + '-31', *RECURRING_FREQUENCIES,
+          month_key(month_index(first_month)) + '-01'))
+    return cursor.fetchall()
+
+
+# Function to yield (user_id, month totals) for every user in id order for reporting jobs,
+# reading one user's entries at a time so memory stays flat however many users there are
+def iter_monthly_totals_by_user(first_month, last_month):
+    cursor = get_connection().cursor()
+    cursor.execute("SELECT DISTINCT user_id FROM budget ORDER BY user_id")
+    for (user_id,) in cursor.fetchall():
+        yield user_id, monthly_totals(get_range_entries(user_id, first_month, last_month), first_month, last_month)
+
+
+# Function to give a user's per-month totals and running balance over a range in one pass
+def get_user_forecast(user_id, first_month, last_month, starting_balance=0.0):
+    totals = monthly_totals(get_range_entries(user_id, first_month, last_month), first_month, last_month)
+
+    forecast = []
+    balance = starting_balance
+    for month, total in zip(month_range(first_month, last_month), totals):
+        balance = round(balance + total, 2)
+        forecast.append({'month': month, 'total': total, 'balance': balance})
+    return forecast
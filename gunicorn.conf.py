@@ -0,0 +1,29 @@
+import multiprocessing
+import os
+
+import db
+
+# Production server settings, run with: gunicorn -c gunicorn.conf.py wsgi:app
+# Each setting can be overridden with a BUDGET_ environment variable
+# Bound to localhost for a reverse proxy to sit in front, set BUDGET_PROXY_HOPS to the number of
+# proxies so rate limits see each client's address instead of the proxy's
+bind = os.environ.get('BUDGET_BIND', '127.0.0.1:8000')
+
+# One process per core, bcrypt and budget expansion are CPU bound. Threads cover the
+# time a request spends waiting on SQLite or the network.
+workers = int(os.environ.get('BUDGET_WEB_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('BUDGET_WEB_THREADS', 4))
+timeout = 60
+graceful_timeout = 30
+
+# Load the app once in the master so migrations run a single time before forking
+preload_app = True
+
+accesslog = '-'
+errorlog = '-'
+
+
+# Function to close the master's connections before forking, so every worker opens its own
+def pre_fork(server, worker):
+    db.close_pools()
@@ -0,0 +1,191 @@
+import csv
+import datetime
+import re
+
+import budget
+import validation
+
+DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y', '%m/%d/%y', '%Y%m%d')
+CHUNK_SIZE = 1000
+MAX_ERRORS = 50
+READ_SIZE = 64 * 1024
+
+# Column headings found in bank exports, mapped to the field they hold
+COLUMN_ALIASES = {
+    'description': 'description',
+    'memo': 'description',
+    'payee': 'description',
+    'name': 'description',
+    'details': 'description',
+    'amount': 'amount',
+    'debit': 'debit',
+    'credit': 'credit',
+    'type': 'type',
+    'frequency': 'frequency',
+    'date': 'date',
+    'posted date': 'date',
+    'posting date': 'date',
+    'transaction date': 'date',
+}
+
+_ofx_tag = re.compile(r'<([^>]+)>([^<]*)')
+
+
+# Raised for a row that can't be imported, the rest of the file carries on
+class ImportRowError(ValueError):
+    pass
+
+
+# Function to turn a bank style amount ("$1,200.50", "(45.00)") into a float, with the
+# same NaN, infinity and size checks as the entry forms
+def parse_amount(value):
+    text = value.strip().replace('$', '')
+    negative = text.startswith('(') and text.endswith(')')
+    try:
+        amount = validation.parse_amount(text.strip('()'))
+    except ValueError as e:
+        raise ImportRowError(f"invalid amount {value!r}: {e}")
+    return -amount if negative else amount
+
+
+# Function to read a description with the same length limit as the entry forms
+def parse_description(value):
+    try:
+        return validation.parse_text(value, 'description')
+    except ValueError as e:
+        raise ImportRowError(str(e))
+
+
+# Function to turn any of the accepted date formats into YYYY-MM-DD, within the
+# same years as the entry forms
+def parse_date(value):
+    value = value.strip()
+    for date_format in DATE_FORMATS:
+        try:
+            date = datetime.datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+        try:
+            return validation.parse_date(date.isoformat())
+        except ValueError as e:
+            raise ImportRowError(f"invalid date {value!r}: {e}")
+    raise ImportRowError(f"invalid date {value!r}")
+
+
+# Function to map one CSV row onto a budget row
+def _csv_row(columns, row):
+    fields = {name: row[index].strip() for name, index in columns.items() if index < len(row)}
+    if not fields.get('description'):
+        raise ImportRowError("missing description")
+    description = parse_description(fields['description'])
+    if not fields.get('date'):
+        raise ImportRowError("missing date")
+    date = parse_date(fields['date'])
+
+    # Banks either give one signed amount column or separate debit and credit columns
+    if fields.get('amount'):
+        amount = budget.normalize_amount(parse_amount(fields['amount']), fields.get('type', '').lower())
+    elif fields.get('debit'):
+        amount = budget.normalize_amount(parse_amount(fields['debit']), 'debit')
+    elif fields.get('credit'):
+        amount = abs(parse_amount(fields['credit']))
+    else:
+        raise ImportRowError("missing amount")
+
+    frequency = fields.get('frequency', '').lower() or 'one_time'
+    if frequency not in validation.FREQUENCIES:
+        raise ImportRowError(f"invalid frequency {frequency!r}")
+    return description, amount, frequency, date
+
+
+# Function to stream (line number, row or error) pairs out of a CSV file
+def iter_csv(text_stream):
+    reader = csv.reader(text_stream)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = {}
+    for index, heading in enumerate(header):
+        name = COLUMN_ALIASES.get(heading.strip().lower())
+        if name and name not in columns:
+            columns[name] = index
+    if 'date' not in columns or 'description' not in columns:
+        raise ImportRowError("CSV needs a date and a description column")
+
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        try:
+            yield reader.line_num, _csv_row(columns, row)
+        except ImportRowError as e:
+            yield reader.line_num, e
+
+
+# Function to map one OFX transaction onto a budget row
+def _ofx_row(fields):
+    description = fields.get('NAME') or fields.get('MEMO')
+    if not description:
+        raise ImportRowError("missing NAME or MEMO")
+    description = parse_description(description)
+    if not fields.get('DTPOSTED'):
+        raise ImportRowError("missing DTPOSTED")
+    date = parse_date(fields['DTPOSTED'][:8])
+    if not fields.get('TRNAMT'):
+        raise ImportRowError("missing TRNAMT")
+    amount = budget.normalize_amount(parse_amount(fields['TRNAMT']), fields.get('TRNTYPE', '').lower())
+    return description, amount, 'one_time', date
+
+
+# Function to stream (transaction number, row or error) pairs out of an OFX/QFX file
+def iter_ofx(text_stream):
+    pending = ''
+    fields = None
+    number = 0
+    while True:
+        chunk = text_stream.read(READ_SIZE)
+        text = pending + chunk
+        # Hold back a tag that may be cut off at the end of the chunk
+        cut = text.rfind('<') if chunk else len(text)
+        if cut == -1:
+            cut = 0
+        pending = text[cut:]
+        for match in _ofx_tag.finditer(text[:cut]):
+            tag = match.group(1).strip().upper()
+            if tag == 'STMTTRN':
+                fields = {}
+            elif tag == '/STMTTRN' and fields is not None:
+                number += 1
+                try:
+                    yield number, _ofx_row(fields)
+                except ImportRowError as e:
+                    yield number, e
+                fields = None
+            elif fields is not None and not tag.startswith('/'):
+                fields[tag] = match.group(2).strip()
+        if not chunk:
+            return
+
+
+# Function to pick the parser from a file name
+def detect_format(filename):
+    if filename.lower().endswith(('.ofx', '.qfx')):
+        return 'ofx'
+    return 'csv'
+
+
+# Function to import a whole file for a user, returning counts and the first few errors
+def import_file(user_id, text_stream, file_format='csv', chunk_size=CHUNK_SIZE, progress=None):
+    parser = iter_ofx if file_format == 'ofx' else iter_csv
+    summary = {'imported': 0, 'skipped': 0, 'errors': []}
+
+    def valid_rows():
+        for line, result in parser(text_stream):
+            if isinstance(result, ImportRowError):
+                summary['skipped'] += 1
+                if len(summary['errors']) < MAX_ERRORS:
+                    summary['errors'].append(f"line {line}: {result}")
+            else:
+                yield result
+
+    summary['imported'] = budget.add_budget_entries(user_id, valid_rows(), chunk_size, progress)
+    return summary
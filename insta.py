@@ -1,34 +1,150 @@
+import io
 import json
-import os
+import posixpath
 import zipfile
 
+FOLLOW_DIR = 'connections/followers_and_following'
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = ' \t\r\n'
 
-def extract_zip(file_path, extract_to):
-    with zipfile.ZipFile(file_path, 'r') as zip_ref:
-        zip_ref.extractall(extract_to)
-
-def parse_followers(directory):
-    follow = []
-    followers_path = os.path.join(directory, 'connections', 'followers_and_following')
-    for filename in os.listdir(followers_path):
-        if filename.startswith('followers') and filename.endswith('.json'):
-            with open(os.path.join(followers_path, filename), 'r') as f:
-                data = json.load(f)
-                for item in data:
-                    idata = item.get('string_list_data')
-                    for d in idata:
-                        follow.append(d.get('value'))
-    return follow
-
-def parse_following(directory):
-    following_path = os.path.join(directory, 'connections', 'followers_and_following', 'following.json')
-    following = []
-    if not os.path.exists(following_path):
-        return None  # Return None if the file does not exist
-    with open(following_path, 'r') as f:
-        data = json.load(f)
-        for item in data.get('relationships_following', []):
-            idata = item.get('string_list_data')
-            for d in idata:
-                following.append(d.get('value'))
-    return following
\ No newline at end of file
+
+# Function to stream the items of a JSON array one at a time without loading the whole file
+def iter_json_array(stream, key=None, chunk_size=CHUNK_SIZE):
+    reader = io.TextIOWrapper(stream, encoding='utf-8')
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+
+    def read_more():
+        nonlocal buffer, eof
+        chunk = reader.read(chunk_size)
+        if chunk:
+            buffer += chunk
+        else:
+            eof = True
+
+    # Find the opening bracket, either the top level array or the one under key
+    marker = '[' if key is None else json.dumps(key)
+    while True:
+        start = buffer.find(marker)
+        if start != -1:
+            pos = start + len(marker)
+            break
+        if eof:
+            return
+        # Keep a tail in case the marker is split across two chunks
+        buffer = buffer[-len(marker):]
+        read_more()
+    if key is not None:
+        # Skip the colon and whitespace between the key and its array
+        while True:
+            while pos < len(buffer) and buffer[pos] in WHITESPACE + ':':
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            read_more()
+        if pos >= len(buffer) or buffer[pos] != '[':
+            return
+        pos += 1
+
+    # Decode one item at a time, dropping what has been consumed
+    while True:
+        while pos < len(buffer) and buffer[pos] in WHITESPACE + ',':
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                return
+            buffer = buffer[pos:]
+            pos = 0
+            read_more()
+            continue
+        if buffer[pos] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            buffer = buffer[pos:]
+            pos = 0
+            read_more()
+            continue
+        yield item
+        pos = end
+        if pos > chunk_size:
+            buffer = buffer[pos:]
+            pos = 0
+
+
+# Function to pull the account names out of a stream of relationship items
+def iter_usernames(items):
+    for item in items:
+        for d in item.get('string_list_data', []):
+            yield d.get('value')
+
+
+# Function to list the follower/following JSON members in the export
+def follow_members(zip_ref, prefix):
+    for name in zip_ref.namelist():
+        folder, filename = posixpath.split(name)
+        if folder.endswith(FOLLOW_DIR) and filename.startswith(prefix) and filename.endswith('.json'):
+            yield name
+
+
+# Function to stream every follower name straight out of the zip
+def iter_followers(zip_ref):
+    for name in follow_members(zip_ref, 'followers'):
+        with zip_ref.open(name) as f:
+            yield from iter_usernames(iter_json_array(f))
+
+
+# Function to stream every followed account name, or None if following.json is missing
+def iter_following(zip_ref):
+    names = list(follow_members(zip_ref, 'following.json'))
+    if not names:
+        return None
+    return _iter_following(zip_ref, names[0])
+
+
+# Function to stream the followed account names from following.json
+def _iter_following(zip_ref, name):
+    with zip_ref.open(name) as f:
+        yield from iter_usernames(iter_json_array(f, 'relationships_following'))
+
+
+# Function to split the accounts into not following back, fans and mutuals in one pass
+def diff_followers(followers, following):
+    # dicts act as ordered sets so each list keeps the order of the export
+    follower_set = dict.fromkeys(followers)
+    following_set = dict.fromkeys(following)
+    not_following_back = []
+    mutuals = []
+    for user in following_set:
+        if user in follower_set:
+            mutuals.append(user)
+        else:
+            not_following_back.append(user)
+    fans = [user for user in follower_set if user not in following_set]
+    return {'not_following_back': not_following_back, 'fans': fans, 'mutuals': mutuals}
+
+
+# Function to open an uploaded export without extracting it to disk
+def open_export(file_obj):
+    return zipfile.ZipFile(file_obj, 'r')
+
+
+# Raised when an uploaded export can't be analyzed, the message is shown to the user
+class ExportError(ValueError):
+    pass
+
+
+# Function to run the whole follower diff on an export saved at path
+def analyze_export(path):
+    try:
+        with open_export(path) as zip_ref:
+            following = iter_following(zip_ref)
+            if following is None:
+                raise ExportError("following.json not found in the zip file")
+            return diff_followers(iter_followers(zip_ref), following)
+    except zipfile.BadZipFile:
+        raise ExportError("The uploaded file is not a valid zip file")
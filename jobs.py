@@ -0,0 +1,183 @@
+from cache import LRUCache
+from concurrent.futures import ThreadPoolExecutor
+from db import close_connection, get_connection
+from metrics import metrics
+
+import hashlib
+import insta
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+WORKERS = 2
+RESULT_CACHE_SIZE = 32
+JOB_TTL = 60 * 60
+READ_SIZE = 1024 * 1024
+STATUS_COLUMNS = ('id', 'status', 'digest', 'created', 'finished', 'error')
+
+logger = logging.getLogger(__name__)
+
+
+# Runs uploaded files through a task on a background pool so request workers stay free.
+# Job state lives in the upload_jobs table so any worker process can report on it, and
+# results are cached by the file's SHA-256 so uploading the same file again is instant.
+class JobQueue:
+    def __init__(self, task, name, workers=WORKERS, cache_size=RESULT_CACHE_SIZE, ttl=JOB_TTL, workdir=None):
+        self.task = task
+        self.name = name
+        self.workers = workers
+        self.ttl = ttl
+        self.workdir = workdir
+        self.app = None
+        self.results_cache = LRUCache(maxsize=cache_size)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    # Function to change the pool size, where uploads are saved and the app jobs run under
+    def configure(self, workers=None, workdir=None, app=None):
+        if workdir is not None:
+            self.workdir = workdir
+        if app is not None:
+            self.app = app
+        if workers is not None and workers != self.workers:
+            old_executor = self._executor
+            self.workers = workers
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=self.name)
+            old_executor.shutdown(wait=False)
+
+    # Function to copy an upload to its own temp file, hashing it on the way
+    def save_upload(self, stream):
+        digest = hashlib.sha256()
+        fd, path = tempfile.mkstemp(suffix='.upload', dir=self.workdir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = stream.read(READ_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    f.write(chunk)
+        except Exception:
+            os.remove(path)
+            raise
+        return path, digest.hexdigest()
+
+    # Function to queue an upload, returning its job (an earlier finished job when the file was seen before)
+    def submit(self, stream):
+        path, digest = self.save_upload(stream)
+        now = time.time()
+        conn = get_connection()
+        conn.execute("DELETE FROM upload_jobs WHERE COALESCE(finished, created) < ?", (now - self.ttl,))
+        conn.commit()
+
+        job_id = self._done_job(digest)
+        with self._lock:
+            # The same file may already be running in this process, share that job
+            job_id = job_id or self._pending.get(digest)
+            run = job_id is None
+            if run:
+                job_id = uuid.uuid4().hex
+                self._pending[digest] = job_id
+                conn.execute('''
+                    INSERT INTO upload_jobs (id, status, digest, created) VALUES (?, 'queued', ?, ?)
+                ''', (job_id, digest, now))
+                conn.commit()
+
+        if run:
+            self._executor.submit(self._process, job_id, digest, path)
+        else:
+            os.remove(path)
+        return self.get(job_id)
+
+    # Function to find the latest finished job for the same file
+    def _done_job(self, digest):
+        cursor = get_connection().cursor()
+        cursor.execute('''
+            SELECT id FROM upload_jobs
+            WHERE digest = ? AND status = 'done'
+            ORDER BY finished DESC LIMIT 1
+        ''', (digest,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    # Function to run the task for one job on a pool thread
+    def _process(self, job_id, digest, path):
+        with self.app.app_context():
+            started = time.perf_counter()
+            self._update(job_id, status='running')
+            # Hand the connection back while the file is analyzed, so request threads aren't left waiting for it
+            close_connection()
+            try:
+                results = self.task(path)
+            except ValueError as e:
+                self._update(job_id, status='failed', error=str(e), finished=time.time())
+            except Exception:
+                logger.exception("%s job %s failed", self.name, job_id)
+                self._update(job_id, status='failed', error="The upload could not be processed", finished=time.time())
+            else:
+                self.results_cache.set(digest, results)
+                self._update(job_id, status='done', results=json.dumps(results), finished=time.time())
+            finally:
+                os.remove(path)
+                metrics.record(f'jobs.{self.name}', time.perf_counter() - started)
+                with self._lock:
+                    self._pending.pop(digest, None)
+
+    # Function to write new values for a job's columns
+    def _update(self, job_id, **fields):
+        assignments = ', '.join(f'{column} = ?' for column in fields)
+        conn = get_connection()
+        conn.execute(f"UPDATE upload_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+        conn.commit()
+
+    # Function to get a job's status without its results, None when unknown or expired
+    def get(self, job_id):
+        cursor = get_connection().cursor()
+        cursor.execute(f"SELECT {', '.join(STATUS_COLUMNS)} FROM upload_jobs WHERE id = ?", (job_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        job = dict(zip(STATUS_COLUMNS, row))
+        # A job left unfinished for longer than the ttl lost its worker process
+        if job['finished'] is None and time.time() - job['created'] > self.ttl:
+            job.update(status='failed', error="The upload timed out, please try again")
+        return job
+
+    # Function to get a finished job's results, None until the job is done
+    def results(self, job_id):
+        job = self.get(job_id)
+        if job is None or job['status'] != 'done':
+            return None
+        results = self.results_cache.get(job['digest'])
+        if results is None:
+            cursor = get_connection().cursor()
+            cursor.execute("SELECT results FROM upload_jobs WHERE id = ?", (job_id,))
+            results = json.loads(cursor.fetchone()[0])
+            self.results_cache.set(job['digest'], results)
+        return results
+
+    # Function to report job counts by status and the results cache counters
+    def stats(self):
+        counts = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+        cursor = get_connection().cursor()
+        cursor.execute("SELECT status, COUNT(*) FROM upload_jobs GROUP BY status")
+        counts.update(cursor.fetchall())
+        counts['workers'] = self.workers
+        counts['results_cache'] = self.results_cache.stats()
+        return counts
+
+
+# Analyzes Instagram exports for /upload
+export_jobs = JobQueue(insta.analyze_export, 'insta')
+
+
+# Function to apply the job pool settings from the Flask config
+def init_app(app):
+    app.config.setdefault('UPLOAD_WORKERS', WORKERS)
+    app.config.setdefault('UPLOAD_FOLDER', None)
+    export_jobs.configure(app.config['UPLOAD_WORKERS'], app.config['UPLOAD_FOLDER'], app)
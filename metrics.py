@@ -0,0 +1,80 @@
+from contextlib import contextmanager
+from flask import g, has_request_context
+
+import re
+import threading
+import time
+
+MAX_QUERY_KEYS = 200
+
+_whitespace = re.compile(r'\s+')
+
+
+# Thread-safe store of timing totals, keyed by what was timed
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timers = {}
+        self._queries = {}
+
+    # Function to add one timing (and optional row count) to a table of totals
+    def _add(self, table, name, seconds, rows=None):
+        with self._lock:
+            stat = table.get(name)
+            if stat is None:
+                if len(table) >= MAX_QUERY_KEYS:
+                    return
+                stat = table[name] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0}
+            ms = seconds * 1000
+            stat['count'] += 1
+            stat['total_ms'] += ms
+            stat['max_ms'] = max(stat['max_ms'], ms)
+            if rows:
+                stat['rows'] += rows
+
+    # Function to record time spent in a named piece of work
+    def record(self, name, seconds):
+        self._add(self._timers, name, seconds)
+
+    # Function to record one SQL statement, also adding it to the current request's totals
+    def record_query(self, sql, seconds, rows=None):
+        self._add(self._queries, _whitespace.sub(' ', sql).strip()[:120], seconds, rows)
+        if has_request_context():
+            g.query_count = g.get('query_count', 0) + 1
+            g.query_ms = g.get('query_ms', 0.0) + seconds * 1000
+
+    # Function to record rows read by a statement that was already timed
+    def record_rows(self, sql, rows):
+        key = _whitespace.sub(' ', sql).strip()[:120]
+        with self._lock:
+            if key in self._queries:
+                self._queries[key]['rows'] += rows
+
+    # Function to time a block of code under a name
+    @contextmanager
+    def timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    # Function to copy out every total with averages filled in
+    def snapshot(self):
+        with self._lock:
+            def finish(table):
+                return {
+                    name: dict(stat, total_ms=round(stat['total_ms'], 3), max_ms=round(stat['max_ms'], 3),
+                               avg_ms=round(stat['total_ms'] / stat['count'], 3))
+                    for name, stat in table.items()
+                }
+            return {'timers': finish(self._timers), 'queries': finish(self._queries)}
+
+    # Function to clear every total
+    def reset(self):
+        with self._lock:
+            self._timers.clear()
+            self._queries.clear()
+
+
+metrics = Metrics()
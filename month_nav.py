@@ -0,0 +1,87 @@
+from dateutil.relativedelta import relativedelta
+
+import datetime
+import threading
+
+MONTHS_BACK = 12
+MONTHS_AHEAD = 12
+
+
+# Function to turn a 'YYYY-MM' key or a date into a running month number
+def month_index(value):
+    if isinstance(value, str):
+        return int(value[:4]) * 12 + int(value[5:7]) - 1
+    return value.year * 12 + value.month - 1
+
+
+# Function to turn a running month number back into a 'YYYY-MM' key
+def month_key(index):
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+
+# Function to list the 'YYYY-MM' keys from months_back before today's month to months_ahead after it
+def generate_month_list(today, months_back=MONTHS_BACK, months_ahead=MONTHS_AHEAD):
+    index = month_index(today)
+    return [month_key(i) for i in range(index - months_back, index + months_ahead + 1)]
+
+
+# Holds the month dropdown and other values that only change when the day does
+class MonthNavigator:
+    def __init__(self, clock=datetime.date.today, months_back=MONTHS_BACK, months_ahead=MONTHS_AHEAD):
+        self.clock = clock
+        self.months_back = months_back
+        self.months_ahead = months_ahead
+        self._lock = threading.Lock()
+        self._values = None
+
+    # Function to change the range, the next lookup rebuilds the values
+    def configure(self, months_back=None, months_ahead=None):
+        with self._lock:
+            if months_back is not None:
+                self.months_back = months_back
+            if months_ahead is not None:
+                self.months_ahead = months_ahead
+            self._values = None
+
+    # Function to get today's values, rebuilding them once the clock rolls over to a new day
+    def _current(self):
+        today = self.clock()
+        values = self._values
+        if values is not None and values['today'] == today:
+            return values
+        with self._lock:
+            if self._values is None or self._values['today'] != today:
+                self._values = {
+                    'today': today,
+                    'months': tuple(generate_month_list(today, self.months_back, self.months_ahead)),
+                    'current_month': today.strftime('%Y-%m'),
+                    # Recurring entries reach the end of the last month in the dropdown
+                    'horizon': today.replace(day=1) + relativedelta(months=self.months_ahead + 1, days=-1),
+                }
+            return self._values
+
+    # Function to get the months offered in the dropdown
+    def months(self):
+        return self._current()['months']
+
+    # Function to get the current 'YYYY-MM' key
+    def current_month(self):
+        return self._current()['current_month']
+
+    # Function to get the last date recurring entries are expanded to
+    def horizon(self):
+        return self._current()['horizon']
+
+    # Function to get the day the values were built for
+    def today(self):
+        return self._current()['today']
+
+
+navigator = MonthNavigator()
+
+
+# Function to apply the dropdown range from the Flask config
+def init_app(app):
+    app.config.setdefault('MONTHS_BACK', MONTHS_BACK)
+    app.config.setdefault('MONTHS_AHEAD', MONTHS_AHEAD)
+    navigator.configure(app.config['MONTHS_BACK'], app.config['MONTHS_AHEAD'])
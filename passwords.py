@@ -0,0 +1,109 @@
+from concurrent.futures import ThreadPoolExecutor
+from metrics import metrics
+
+import bcrypt
+import logging
+import threading
+import time
+
+ROUNDS = 12
+WORKERS = 4
+
+logger = logging.getLogger(__name__)
+
+
+# Runs bcrypt on a bounded pool so a burst of logins can't tie up every request thread
+class PasswordHasher:
+    def __init__(self, rounds=ROUNDS, workers=WORKERS):
+        self.rounds = rounds
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._wait_total = 0.0
+        self._run_total = 0.0
+        self._run_max = 0.0
+
+    # Function to change the cost or pool size, replacing the pool if needed
+    def configure(self, rounds=None, workers=None):
+        if rounds is not None:
+            self.rounds = rounds
+        if workers is not None and workers != self.workers:
+            old_executor = self._executor
+            self.workers = workers
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+            old_executor.shutdown(wait=False)
+
+    # Function to run one bcrypt call on the pool and wait for its result
+    def _run(self, func, *args):
+        submitted = time.perf_counter()
+        with self._lock:
+            self._queued += 1
+
+        def task():
+            started = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+            try:
+                return func(*args)
+            finally:
+                finished = time.perf_counter()
+                metrics.record(f'bcrypt.{func.__name__}', finished - started)
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._wait_total += started - submitted
+                    self._run_total += finished - started
+                    self._run_max = max(self._run_max, finished - started)
+                logger.debug("bcrypt waited %.1f ms, ran %.1f ms",
+                             (started - submitted) * 1000, (finished - started) * 1000)
+
+        return self._executor.submit(task).result()
+
+    # Function to hash a password at the configured cost
+    def hash(self, password):
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        return self._run(bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+    # Function to check a password against a stored hash
+    def check(self, password, stored_hash):
+        if isinstance(stored_hash, str):
+            stored_hash = stored_hash.encode('utf-8')
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), stored_hash)
+
+    # Function to tell if a stored hash was made with a different cost than configured
+    def needs_rehash(self, stored_hash):
+        if isinstance(stored_hash, bytes):
+            stored_hash = stored_hash.decode('utf-8')
+        try:
+            return int(stored_hash.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    # Function to report queue depth and latency of the hashing pool
+    def stats(self):
+        with self._lock:
+            completed = self._completed or 1
+            return {
+                'rounds': self.rounds,
+                'workers': self.workers,
+                'queued': self._queued,
+                'running': self._running,
+                'completed': self._completed,
+                'avg_wait_ms': round(self._wait_total / completed * 1000, 2),
+                'avg_run_ms': round(self._run_total / completed * 1000, 2),
+                'max_run_ms': round(self._run_max * 1000, 2),
+            }
+
+
+hasher = PasswordHasher()
+
+
+# Function to apply the bcrypt settings from the Flask config
+def init_app(app):
+    app.config.setdefault('BCRYPT_ROUNDS', ROUNDS)
+    app.config.setdefault('BCRYPT_WORKERS', WORKERS)
+    hasher.configure(app.config['BCRYPT_ROUNDS'], app.config['BCRYPT_WORKERS'])
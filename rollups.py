@@ -0,0 +1,224 @@
+from collections import defaultdict
+from db import get_connection
+from month_nav import month_index, month_key, navigator
+
+import budget
+import datetime
+import logging
+
+# Months past the current one that recurring entries are rolled up through
+ROLLUP_MONTHS_AHEAD = 24
+
+logger = logging.getLogger(__name__)
+
+
+# Function to get the month new rollups are kept through
+def default_through():
+    return month_key(month_index(navigator.today()) + ROLLUP_MONTHS_AHEAD)
+
+
+# Function to add up what (description, amount, frequency, date) entries put into each month
+# from first_month to last_month, keyed by (month, description) as [income, expense, occurrences]
+def entry_deltas(entries, first_month, last_month, sign=1):
+    deltas = defaultdict(lambda: [0.0, 0.0, 0])
+    first = month_index(first_month)
+    last = month_index(last_month)
+    if first > last:
+        return deltas
+    window_start = datetime.date(first // 12, first % 12 + 1, 1)
+    window_end = datetime.date((last + 1) // 12, (last + 1) % 12 + 1, 1) - datetime.timedelta(days=1)
+    for description, amount, frequency, date in entries:
+        start_date = datetime.date.fromisoformat(date)
+        for occurrence in budget.iter_occurrences(start_date, frequency, window_start, window_end):
+            _count(deltas[(f'{occurrence.year:04d}-{occurrence.month:02d}', description)], amount, sign)
+    return deltas
+
+
+# Function to add one occurrence of an amount into a [income, expense, occurrences] delta
+def _count(delta, amount, sign):
+    if amount >= 0:
+        delta[0] += sign * amount
+    else:
+        delta[1] -= sign * amount
+    delta[2] += sign
+
+
+# Function to add up what entries put into rollups kept through a month. A one time entry
+# counts in its own month even past that, as extending the rollups only expands recurring entries.
+def rollup_deltas(entries, through, sign=1):
+    recurring = []
+    one_time = defaultdict(lambda: [0.0, 0.0, 0])
+    for entry in entries:
+        description, amount, frequency, date = entry
+        if frequency in budget.RECURRING_FREQUENCIES:
+            recurring.append(entry)
+        else:
+            _count(one_time[(date[:7], description)], amount, sign)
+    deltas = entry_deltas(recurring, '0001-01', through, sign)
+    for key, delta in one_time.items():
+        _merge(deltas[key], delta)
+    return deltas
+
+
+# Function to add one delta into another
+def _merge(delta, other):
+    delta[0] += other[0]
+    delta[1] += other[1]
+    delta[2] += other[2]
+
+
+# Function to add deltas into a user's rollup rows
+def _write_deltas(cursor, user_id, deltas):
+    cursor.executemany('''
+        INSERT INTO budget_rollups (user_id, month, description, income, expense, occurrences)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, month, description) DO UPDATE SET
+            income = income + excluded.income,
+            expense = expense + excluded.expense,
+            occurrences = occurrences + excluded.occurrences
+    ''', [(user_id, month, description, income, expense, occurrences)
+          for (month, description), (income, expense, occurrences) in deltas.items()])
+    cursor.execute("DELETE FROM budget_rollups WHERE user_id = ? AND occurrences <= 0", (user_id,))
+
+
+# Function to get the month a user's rollups are kept through, None when they were never built
+def get_through(cursor, user_id):
+    cursor.execute("SELECT through_month FROM rollup_horizons WHERE user_id = ?", (user_id,))
+    result = cursor.fetchone()
+    return result[0] if result else None
+
+
+# Function to keep a user's rollups in step with a write, called inside the write's
+# transaction after the budget table has changed. Entries are (description, amount, frequency, date).
+def apply(cursor, user_id, added=(), removed=()):
+    through = get_through(cursor, user_id)
+    if through is None:
+        # First write since rollups were added, build them from the table as it now stands
+        rebuild_user(cursor, user_id)
+        return
+    deltas = rollup_deltas(added, through)
+    for key, delta in rollup_deltas(removed, through, sign=-1).items():
+        _merge(deltas[key], delta)
+    _write_deltas(cursor, user_id, deltas)
+
+
+# Function to regenerate one user's rollups from their budget entries
+def rebuild_user(cursor, user_id, through=None):
+    # A NULL user_id would be given the next rowid in rollup_horizons, i.e. a real user's id
+    if user_id is None:
+        raise ValueError("Rollups need a user id")
+    through = through or default_through()
+    cursor.execute("DELETE FROM budget_rollups WHERE user_id = ?", (user_id,))
+    cursor.execute("SELECT description, amount, frequency, date FROM budget WHERE user_id = ?", (user_id,))
+    _write_deltas(cursor, user_id, rollup_deltas(cursor.fetchall(), through))
+    cursor.execute('''
+        INSERT INTO rollup_horizons (user_id, through_month) VALUES (?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET through_month = excluded.through_month
+    ''', (user_id, through))
+
+
+# Function to regenerate the rollups of every user, or just the given one, one user per transaction
+def rebuild(user_id=None):
+    conn = get_connection()
+    cursor = conn.cursor()
+    if user_id is None:
+        cursor.execute("SELECT DISTINCT user_id FROM budget")
+        user_ids = [row[0] for row in cursor.fetchall()]
+        # Users without entries left keep no rollups
+        cursor.execute("DELETE FROM budget_rollups WHERE user_id NOT IN (SELECT user_id FROM budget)")
+        conn.commit()
+    else:
+        user_ids = [user_id]
+    for rebuild_id in user_ids:
+        try:
+            rebuild_user(cursor, rebuild_id)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.exception("An error occurred rebuilding rollups for user %s", rebuild_id)
+            raise
+    return len(user_ids)
+
+
+# Function to make sure a user's rollups exist and reach last_month, extending them if needed
+def ensure(user_id, last_month):
+    if user_id is None:
+        raise ValueError("Rollups need a user id")
+    conn = get_connection()
+    cursor = conn.cursor()
+    through = get_through(cursor, user_id)
+    if through is not None and last_month <= through:
+        return
+    try:
+        # Take the write lock before reading the horizon again, so two requests can't both
+        # extend the same months and no write can land between the read and the extension
+        cursor.execute("BEGIN IMMEDIATE")
+        through = get_through(cursor, user_id)
+        if through is None:
+            rebuild_user(cursor, user_id, max(last_month, default_through()))
+        elif last_month > through:
+            # One time entries are already counted wherever they fall, only recurring ones reach the new months
+            new_through = max(last_month, default_through())
+            placeholders = ', '.join('?' for _ in budget.RECURRING_FREQUENCIES)
+            cursor.execute(f'''
+                SELECT description, amount, frequency, date FROM budget
+                WHERE user_id = ? AND frequency IN ({placeholders})
+            ''', (user_id, *budget.RECURRING_FREQUENCIES))
+            first = month_key(month_index(through) + 1)
+            _write_deltas(cursor, user_id, entry_deltas(cursor.fetchall(), first, new_through))
+            cursor.execute("UPDATE rollup_horizons SET through_month = ? WHERE user_id = ?", (new_through, user_id))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        logger.exception("An error occurred extending rollups for user %s", user_id)
+        raise
+
+
+# Function to get income, expense and net per month from first_month to last_month
+def get_monthly_summary(user_id, first_month, last_month):
+    ensure(user_id, last_month)
+    cursor = get_connection().cursor()
+    cursor.execute('''
+        SELECT month, SUM(income), SUM(expense)
+        FROM budget_rollups
+        WHERE user_id = ? AND month BETWEEN ? AND ?
+        GROUP BY month
+    ''', (user_id, first_month, last_month))
+    totals = {month: (income, expense) for month, income, expense in cursor.fetchall()}
+    summary = []
+    for index in range(month_index(first_month), month_index(last_month) + 1):
+        month = month_key(index)
+        income, expense = totals.get(month, (0.0, 0.0))
+        summary.append({'month': month, 'income': round(income, 2), 'expense': round(expense, 2),
+                        'net': round(income - expense, 2)})
+    return summary
+
+
+# Function to get income and expense per description over a range, largest expense first
+def get_description_summary(user_id, first_month, last_month):
+    ensure(user_id, last_month)
+    cursor = get_connection().cursor()
+    cursor.execute('''
+        SELECT description, SUM(income), SUM(expense), SUM(occurrences)
+        FROM budget_rollups
+        WHERE user_id = ? AND month BETWEEN ? AND ?
+        GROUP BY description
+        ORDER BY SUM(expense) DESC, SUM(income) DESC, description
+    ''', (user_id, first_month, last_month))
+    return [{'description': description, 'income': round(income, 2), 'expense': round(expense, 2),
+             'net': round(income - expense, 2), 'occurrences': occurrences}
+            for description, income, expense, occurrences in cursor.fetchall()]
+
+
+# Function to get every (month, description) rollup row over a range, for exports
+def get_rollup_rows(user_id, first_month, last_month):
+    ensure(user_id, last_month)
+    cursor = get_connection().cursor()
+    cursor.execute('''
+        SELECT month, description, income, expense, occurrences
+        FROM budget_rollups
+        WHERE user_id = ? AND month BETWEEN ? AND ?
+        ORDER BY month, description
+    ''', (user_id, first_month, last_month))
+    return [(month, description, round(income, 2), round(expense, 2), occurrences)
+            for month, description, income, expense, occurrences in cursor.fetchall()]
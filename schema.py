@@ -0,0 +1,91 @@
+from db import get_connection
+
+
+# Ordered list of schema migrations, the position + 1 is the schema version
+MIGRATIONS = [
+    # 1: base tables plus the indexes the per-user queries rely on
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        username TEXT NOT NULL,
+        password_hash TEXT NOT NULL
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users (username);
+
+    CREATE TABLE IF NOT EXISTS budget (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        description TEXT NOT NULL,
+        amount REAL NOT NULL,
+        frequency TEXT NOT NULL,
+        date TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_budget_user_date ON budget (user_id, date);
+    ''',
+    # 2: per-user data version, bumped by every write to the user's budget rows
+    '''
+    CREATE TABLE IF NOT EXISTS budget_versions (
+        user_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    ''',
+    # 3: upload jobs, kept in the database so every worker process sees the same state
+    '''
+    CREATE TABLE IF NOT EXISTS upload_jobs (
+        id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        digest TEXT NOT NULL,
+        created REAL NOT NULL,
+        finished REAL,
+        error TEXT,
+        results TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_upload_jobs_digest ON upload_jobs (digest, status);
+    CREATE INDEX IF NOT EXISTS idx_upload_jobs_finished ON upload_jobs (finished);
+    ''',
+    # 4: login and registration attempts, used when THROTTLE_STORE is 'sqlite'
+    '''
+    CREATE TABLE IF NOT EXISTS throttle_hits (
+        key TEXT NOT NULL,
+        at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_throttle_hits_key_at ON throttle_hits (key, at);
+    CREATE INDEX IF NOT EXISTS idx_throttle_hits_at ON throttle_hits (at);
+    ''',
+    # 5: per-user, per-month income and expense by description, kept up to date by every
+    # budget write. Filled per user on first use or by the rebuild-rollups command.
+    '''
+    CREATE TABLE IF NOT EXISTS budget_rollups (
+        user_id INTEGER NOT NULL,
+        month TEXT NOT NULL,
+        description TEXT NOT NULL,
+        income REAL NOT NULL,
+        expense REAL NOT NULL,
+        occurrences INTEGER NOT NULL,
+        PRIMARY KEY (user_id, month, description)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS rollup_horizons (
+        user_id INTEGER PRIMARY KEY,
+        through_month TEXT NOT NULL
+    );
+    ''',
+]
+
+
+# Function to read the schema version stored in the database file
+def get_version(conn=None):
+    conn = conn or get_connection()
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+# Function to bring the database up to the latest schema version
+def migrate(conn=None):
+    conn = conn or get_connection()
+    version = get_version(conn)
+    for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+        # Each migration and its version bump are applied in one transaction
+        conn.executescript(f'BEGIN;\n{script}\nPRAGMA user_version = {number};\nCOMMIT;')
+    return get_version(conn)
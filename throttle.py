@@ -0,0 +1,166 @@
+from collections import deque, namedtuple
+from db import get_connection
+
+import math
+import threading
+import time
+
+# How many attempts each scope allows inside its sliding window of seconds
+Limit = namedtuple('Limit', 'limit window')
+LIMITS = {
+    'login_ip': Limit(20, 5 * 60),       # every login attempt from one address
+    'login_user': Limit(5, 15 * 60),     # failed logins for one username
+    'register_ip': Limit(5, 60 * 60),    # registrations from one address
+}
+SWEEP_EVERY = 1000
+
+
+# Keeps recent attempt times per key in this process. Each key holds at most `keep`
+# timestamps, as older ones can't change whether the limit is reached.
+class MemoryStore:
+    def __init__(self):
+        self._hits = {}
+        self._lock = threading.Lock()
+
+    # Function to record an attempt
+    def add(self, key, now, keep):
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None or hits.maxlen != keep:
+                hits = self._hits[key] = deque(hits or (), maxlen=keep)
+            hits.append(now)
+
+    # Function to count the attempts made since a time, with the oldest of them
+    def window(self, key, since):
+        with self._lock:
+            hits = self._hits.get(key)
+            if not hits:
+                return 0, None
+            recent = [at for at in hits if at >= since]
+            return len(recent), (recent[0] if recent else None)
+
+    # Function to forget a key's attempts
+    def clear(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+
+    # Function to drop every key with no attempts since a time
+    def sweep(self, before):
+        with self._lock:
+            for key in [key for key, hits in self._hits.items() if not hits or hits[-1] < before]:
+                del self._hits[key]
+
+    # Function to count the keys being tracked
+    def size(self):
+        with self._lock:
+            return len(self._hits)
+
+
+# Keeps attempt times in the throttle_hits table so every worker process shares the counts
+class SQLiteStore:
+    # Function to record an attempt
+    def add(self, key, now, keep):
+        conn = get_connection()
+        conn.execute("INSERT INTO throttle_hits (key, at) VALUES (?, ?)", (key, now))
+        conn.commit()
+
+    # Function to count the attempts made since a time, with the oldest of them
+    def window(self, key, since):
+        cursor = get_connection().cursor()
+        cursor.execute("SELECT COUNT(*), MIN(at) FROM throttle_hits WHERE key = ? AND at >= ?", (key, since))
+        return cursor.fetchone()
+
+    # Function to forget a key's attempts
+    def clear(self, key):
+        conn = get_connection()
+        conn.execute("DELETE FROM throttle_hits WHERE key = ?", (key,))
+        conn.commit()
+
+    # Function to drop every attempt older than a time
+    def sweep(self, before):
+        conn = get_connection()
+        conn.execute("DELETE FROM throttle_hits WHERE at < ?", (before,))
+        conn.commit()
+
+    # Function to count the keys being tracked
+    def size(self):
+        cursor = get_connection().cursor()
+        cursor.execute("SELECT COUNT(DISTINCT key) FROM throttle_hits")
+        return cursor.fetchone()[0]
+
+
+# Sliding window rate limits, checked before any password is looked up or hashed
+class Throttle:
+    def __init__(self, store=None, limits=LIMITS, clock=time.time):
+        self.store = store or MemoryStore()
+        self.limits = dict(limits)
+        self.clock = clock
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._adds = 0
+        self._blocked = 0
+
+    # Function to switch the throttle on or off or change where attempts are kept
+    def configure(self, enabled=None, store=None, limits=None):
+        if enabled is not None:
+            self.enabled = enabled
+        if store is not None:
+            self.store = store
+        if limits:
+            self.limits.update(limits)
+
+    # Function to get how many seconds until every (scope, key) pair is back under its limit, 0 if it already is
+    def retry_after(self, *checks):
+        if not self.enabled:
+            return 0
+        now = self.clock()
+        wait = 0
+        for scope, key in checks:
+            limit, window = self.limits[scope]
+            count, oldest = self.store.window(f'{scope}:{key}', now - window)
+            if count >= limit:
+                wait = max(wait, math.ceil(oldest + window - now))
+        if wait:
+            with self._lock:
+                self._blocked += 1
+        return wait
+
+    # Function to record an attempt against a scope
+    def hit(self, scope, key):
+        if not self.enabled:
+            return
+        now = self.clock()
+        self.store.add(f'{scope}:{key}', now, self.limits[scope].limit)
+        with self._lock:
+            self._adds += 1
+            sweep = self._adds % SWEEP_EVERY == 0
+        if sweep:
+            self.store.sweep(now - max(window for _, window in self.limits.values()))
+
+    # Function to forget the attempts against a scope, e.g. after a successful login
+    def reset(self, scope, key):
+        if self.enabled:
+            self.store.clear(f'{scope}:{key}')
+
+    # Function to report how often requests were turned away
+    def stats(self):
+        keys = self.store.size()
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'store': type(self.store).__name__,
+                'keys': keys,
+                'attempts': self._adds,
+                'blocked': self._blocked,
+            }
+
+
+limiter = Throttle()
+
+
+# Function to apply the throttle settings from the Flask config
+def init_app(app):
+    app.config.setdefault('THROTTLE_ENABLED', True)
+    app.config.setdefault('THROTTLE_STORE', 'memory')
+    store = SQLiteStore() if app.config['THROTTLE_STORE'] == 'sqlite' else MemoryStore()
+    limiter.configure(app.config['THROTTLE_ENABLED'], store)
@@ -1,75 +1,59 @@
-import bcrypt
-import re
+import logging
 import sqlite3
-import threading
+from db import get_connection
+from passwords import hasher
 
-# Create a thread-local storage for the SQLite connection
-local = threading.local()
+import validation
 
-# Functions to connect to the SQLite database
+logger = logging.getLogger(__name__)
+
+
+# Functions to get a cursor on the shared connection
 def get_cursor():
     conn = get_connection()
     return conn.cursor()
 
 
-def get_connection():
-    if not hasattr(local, 'conn'):
-        local.conn = sqlite3.connect('budget.db')
-    return local.conn
-
-
-def close_connection():
-    if hasattr(local, 'conn'):
-        local.conn.close()
-        del local.conn
-
-
 # Function to register new user
 def register_user(name, username, password):
     conn = get_connection()
     cursor = conn.cursor()
     if not is_valid_password(password):
-        close_connection()
-        return "Password must be 8 characters and contain one of the following: Upper Case, Number, and Symbol"
+        return validation.PASSWORD_MESSAGE
+    # Skip the hashing work when the username is already taken
+    cursor.execute("SELECT 1 FROM users WHERE username=?", (username,))
+    if cursor.fetchone():
+        return "Username already exists"
     else:
         try:
-            password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            password_hash = hasher.hash(password)
             cursor.execute("INSERT INTO users (name, username, password_hash) VALUES (?, ?, ?)", (name, username, password_hash))
             conn.commit()
-            close_connection()
             return "Registration successful"
         except sqlite3.IntegrityError:
-            close_connection()
+            conn.rollback()
             return "Username already exists"
 
 
-# Function to validate password entries and changes
+# Function to validate password entries and changes, the rules live in validation.py
 def is_valid_password(password):
-    upper_regex = re.compile(r'[A-Z]')
-    digit_regex = re.compile(r'\d')
-    symbol_regex = re.compile(r'[!@#$%^&*()_+{}[\]:;<>,.?/~]')
-    has_uppercase = bool(upper_regex.search(password))
-    has_digit = bool(digit_regex.search(password))
-    has_symbol = bool(symbol_regex.search(password))
-    length_valid = len(password) >= 8
-    return has_uppercase and has_digit and has_symbol and length_valid
+    return validation.is_valid_password(password)
 
 
 # Function to verify password
 def verify_login(username, password):
     conn = get_connection()
     cursor = conn.cursor()
-    try:
-        cursor.execute("SELECT password_hash FROM users WHERE username=?", (username,))
-        result = cursor.fetchone()
-        if result:
-            stored_hash = result[0]
-            if isinstance(stored_hash, str): 
-                stored_hash = stored_hash.encode('utf-8')
-            if bcrypt.checkpw(password.encode('utf-8'), stored_hash):
-                return True
-    finally:
-        close_connection()
+    cursor.execute("SELECT password_hash FROM users WHERE username=?", (username,))
+    result = cursor.fetchone()
+    if result:
+        stored_hash = result[0]
+        if hasher.check(password, stored_hash):
+            # Upgrade hashes made with an older cost while we have the plain password
+            if hasher.needs_rehash(stored_hash):
+                cursor.execute('UPDATE users SET password_hash = ? WHERE username = ?', (hasher.hash(password), username))
+                conn.commit()
+            return True
     return False
 
 
@@ -79,7 +63,6 @@ def delete_user(username):
     cursor = conn.cursor()
     cursor.execute("DELETE FROM users WHERE username=?", (username,))
     conn.commit()
-    close_connection()
 
 
 # Function to get name from database
@@ -88,20 +71,29 @@ def get_name(username):
     cursor = conn.cursor()
     cursor.execute("SELECT name FROM users WHERE username = ?", (username,))
     result = cursor.fetchone()
-    close_connection()
     if result:
         return result[0]
     else:
         return None
 
 
+# Function to get the fields that never change for a user in one lookup
+def get_profile(username):
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, name FROM users WHERE username = ?', (username,))
+    result = cursor.fetchone()
+    if result:
+        return {'id': result[0], 'name': result[1]}
+    return None
+
+
 # Function to get user ID
 def get_user_id(username):
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT id FROM users WHERE username = ?', (username,))
     result = cursor.fetchone()
-    close_connection()
     if result:
         return result[0]
     return None
@@ -110,40 +102,36 @@ def get_user_id(username):
 # Function for user to change password
 def change_password(username, current_password, new_password):
     if not is_valid_password(new_password):
-        raise ValueError("Password must be 8 characters and contain one of the following: Upper Case, Number, and Symbol")
+        raise ValueError(validation.PASSWORD_MESSAGE)
     
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT password_hash FROM users WHERE username=?", (username,))
     result = cursor.fetchone()
-    if not result or not bcrypt.checkpw(current_password.encode('utf-8'), result[0].encode('utf-8')):
-        close_connection()
+    if not result or not hasher.check(current_password, result[0]):
         raise ValueError("Current password is incorrect")
     try:
-        hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        hashed_password = hasher.hash(new_password)
         cursor.execute('UPDATE users SET password_hash = ? WHERE username = ?', (hashed_password, username))
-    except Exception as e:
-        print(f"An error occurred: {e}")
+    except Exception:
+        logger.exception("An error occurred updating the password for %s", username)
         raise
     conn.commit()
-    close_connection()
 
 
 # Function for admin to reset user's password to a default value
 def reset_password(username):
     default_password = "Budget1!"
-    hashed_password = bcrypt.hashpw(default_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT id FROM users WHERE username=?", (username,))
     result = cursor.fetchone()
     if not result:
-        close_connection()
         raise ValueError("Username does not exist")
+    hashed_password = hasher.hash(default_password)
     try:
         cursor.execute('UPDATE users SET password_hash = ? WHERE username = ?', (hashed_password, username))
-    except Exception as e:
-        print(f"An error occurred: {e}")
+    except Exception:
+        logger.exception("An error occurred updating the password for %s", username)
         raise
     conn.commit()
-    close_connection()
@@ -0,0 +1,219 @@
+import datetime
+import math
+import re
+
+FREQUENCIES = ('one_time', 'weekly', 'monthly', 'quarterly', 'yearly')
+TYPES = ('credit', 'debit')
+MIN_PASSWORD_LENGTH = 8
+MAX_TEXT_LENGTH = 200
+MAX_USERNAME_LENGTH = 64
+MAX_AMOUNT = 1000000000
+# Dates and months outside these years are refused, which keeps month arithmetic well inside datetime's range
+MIN_YEAR = 1900
+MAX_YEAR = 2999
+PASSWORD_MESSAGE = "Password must be 8 characters and contain one of the following: Upper Case, Number, and Symbol"
+
+# Compiled once at import instead of on every password check
+_password_rules = (
+    re.compile(r'[A-Z]'),
+    re.compile(r'\d'),
+    re.compile(r'[!@#$%^&*()_+{}[\]:;<>,.?/~]'),
+)
+_month = re.compile(r'(\d{4})-(0[1-9]|1[0-2])')
+_date = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+# Raised with every problem found in a form, keyed by field name
+class ValidationError(ValueError):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('; '.join(errors.values()))
+
+
+# Function to tell if a password meets the length and character rules
+def is_valid_password(password):
+    if not password or len(password) < MIN_PASSWORD_LENGTH:
+        return False
+    return all(rule.search(password) for rule in _password_rules)
+
+
+# Function to read a required piece of text, trimmed and capped in length
+def parse_text(value, label='value', max_length=MAX_TEXT_LENGTH):
+    value = (value or '').strip()
+    if not value:
+        raise ValueError(f"{label} is required")
+    if len(value) > max_length:
+        raise ValueError(f"{label} must be at most {max_length} characters")
+    return value
+
+
+# Function to read an amount as a float, rejecting text, NaN and absurd sizes
+def parse_amount(value, label='Amount'):
+    try:
+        amount = float((value or '').strip().replace(',', ''))
+    except ValueError:
+        raise ValueError(f"{label} must be a number")
+    if not math.isfinite(amount) or abs(amount) > MAX_AMOUNT:
+        raise ValueError(f"{label} is out of range")
+    return amount
+
+
+# Function to read an optional whole number that has to fall between low and high
+def parse_int(value, label, default, low, high):
+    value = (value or '').strip()
+    if not value:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{label} must be a whole number")
+    if not low <= number <= high:
+        raise ValueError(f"{label} must be between {low} and {high}")
+    return number
+
+
+# Function to read a YYYY-MM-DD date, returned in the same form
+def parse_date(value):
+    value = (value or '').strip()
+    try:
+        if not _date.fullmatch(value):
+            raise ValueError
+        date = datetime.date.fromisoformat(value)
+    except ValueError:
+        raise ValueError("Date must look like 2026-01-31")
+    if not MIN_YEAR <= date.year <= MAX_YEAR:
+        raise ValueError(f"Date must be between the years {MIN_YEAR} and {MAX_YEAR}")
+    return date.isoformat()
+
+
+# Function to read a YYYY-MM month key
+def parse_month(value, label='month'):
+    value = (value or '').strip()
+    match = _month.fullmatch(value)
+    if not match or not MIN_YEAR <= int(match.group(1)) <= MAX_YEAR:
+        raise ValueError(f"{label} must be a month like 2026-01")
+    return value
+
+
+# Function to read an optional 'date:id' key marking where the previous page of entries ended
+def parse_page_key(value):
+    value = (value or '').strip()
+    if not value:
+        return None
+    after_date, _, after_id = value.rpartition(':')
+    try:
+        return parse_date(after_date), parse_int(after_id, 'after', None, 1, 2 ** 63 - 1)
+    except ValueError:
+        raise ValueError("after must be a page key like 2026-01-31:42")
+
+
+# Function to read one of the supported frequencies
+def parse_frequency(value):
+    value = (value or '').strip().lower()
+    if value not in FREQUENCIES:
+        raise ValueError(f"Frequency must be one of {', '.join(FREQUENCIES)}")
+    return value
+
+
+# Function to read credit or debit
+def parse_type(value):
+    value = (value or '').strip().lower()
+    if value not in TYPES:
+        raise ValueError("Type must be credit or debit")
+    return value
+
+
+# Function to read a new password that has to meet the rules
+def parse_password(value):
+    if not is_valid_password(value):
+        raise ValueError(PASSWORD_MESSAGE)
+    return value
+
+
+# Function to read a password that only has to be present, e.g. when logging in
+def parse_existing_password(value):
+    if not value:
+        raise ValueError("Password is required")
+    return value
+
+
+# Function to run each field of a form through its parser, collecting every problem at once
+def validate(form, rules):
+    cleaned = {}
+    errors = {}
+    for field, parse in rules.items():
+        try:
+            cleaned[field] = parse(form.get(field))
+        except ValueError as e:
+            errors[field] = str(e)
+    if errors:
+        raise ValidationError(errors)
+    return cleaned
+
+
+# Function to check that a confirmation field matches
+def require_match(cleaned, form, field, confirm_field, message):
+    if form.get(confirm_field) != cleaned[field]:
+        raise ValidationError({confirm_field: message})
+    return cleaned
+
+
+# Function to validate the registration form
+def registration_form(form):
+    cleaned = validate(form, {
+        'name': lambda value: parse_text(value, 'Name'),
+        'username': lambda value: parse_text(value, 'Username', MAX_USERNAME_LENGTH),
+        'password': parse_password,
+    })
+    return require_match(cleaned, form, 'password', 'confirm_password', "Passwords do not match")
+
+
+# Function to validate the login form
+def login_form(form):
+    return validate(form, {
+        'username': lambda value: parse_text(value, 'Username', MAX_USERNAME_LENGTH),
+        'password': parse_existing_password,
+    })
+
+
+# Function to validate the change password form
+def password_change_form(form):
+    cleaned = validate(form, {
+        'current_password': parse_existing_password,
+        'new_password': parse_password,
+    })
+    return require_match(cleaned, form, 'new_password', 'confirm_password',
+                         "New password and confirm password do not match")
+
+
+# Function to validate the filters and position of a page of entries
+def entry_page_args(args, default_size, max_size):
+    return validate(args, {
+        'q': lambda value: parse_text(value, 'Description filter') if (value or '').strip() else '',
+        'frequency': lambda value: parse_frequency(value) if (value or '').strip() else '',
+        'per_page': lambda value: parse_int(value, 'per_page', default_size, 1, max_size),
+        'after': parse_page_key,
+    })
+
+
+# Function to validate the new budget entry form
+def budget_entry_form(form):
+    return validate(form, {
+        'description': lambda value: parse_text(value, 'Description'),
+        'amount': parse_amount,
+        'type': parse_type,
+        'frequency': parse_frequency,
+        'date': parse_date,
+    })
+
+
+# Function to validate one row of the edit page, whose fields are suffixed with the entry id
+def entry_update_form(form, entry_id):
+    row = {field: form.get(f'{field}_{entry_id}') for field in ('description', 'amount', 'frequency', 'date')}
+    cleaned = validate(row, {
+        'description': lambda value: parse_text(value, 'Description'),
+        'amount': parse_amount,
+        'frequency': parse_frequency,
+        'date': parse_date,
+    })
+    return entry_id, cleaned['description'], cleaned['amount'], cleaned['frequency'], cleaned['date']
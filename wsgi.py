@@ -0,0 +1,5 @@
+from app import create_app
+
+# Entry point for a WSGI server, e.g. gunicorn -c gunicorn.conf.py wsgi:app
+# Logs go to stderr so the server collects them from every worker process
+app = create_app({'LOG_FILE': None})